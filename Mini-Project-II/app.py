@@ -1,11 +1,20 @@
 ### UPDATED app.py (single best theme, with animated flip cards)
 
 import streamlit as st
-from flashcard import generate_flashcards, get_flashcard_word_count
-from image_processing import extract_text
-from text_to_speech import text_to_speech
+from flashcard import get_flashcard_word_count, warm_up_models
+from model_registry import registry
+from jobs import job_queue, submit_generation, submit_image_generation
+from incremental import IncrementalDeck
+from deck_store import deck_store
+from card_search import card_index, search_cards, sync_card_index
+from text_to_speech import audio_mime_type, prefetch, synthesize_async
 import random
+import time
 import os
+import metrics
+
+# Cards ahead of the current one whose audio is synthesized in the background
+AUDIO_PREFETCH = 3
 
 # Page configuration
 st.set_page_config(
@@ -34,14 +43,45 @@ def initialize_state():
         'input_method': "Text",
         'text_word_count': 0,
         'flashcard_word_count': 0,
-        'card_flipped': False
+        'card_flipped': False,
+        'job_id': None,
+        'last_timings': {}
     }
     for key, val in state_defaults.items():
         if key not in st.session_state:
             st.session_state[key] = val
+    # Previous sentences, vectors and scores, so edits to the text are regenerated incrementally
+    if 'incremental_deck' not in st.session_state:
+        st.session_state.incremental_deck = IncrementalDeck()
 
 initialize_state()
 
+# Load models once per process; every session shares the same instances
+@st.cache_resource(show_spinner="Loading models...")
+def load_models():
+    warm_up_models()
+    # Prometheus scrape endpoint for the whole process, if a port is configured
+    metrics_port = os.environ.get("FLASHCARD_METRICS_PORT")
+    if metrics_port:
+        metrics.start_http_server(int(metrics_port))
+    # Pick up decks stored before the vector index existed (or by other processes)
+    sync_card_index()
+    return registry
+
+load_models()
+
+# How often the page re-checks a running background job
+JOB_POLL_SECONDS = 0.75
+
+def apply_deck(flashcards, source_text):
+    st.session_state.flashcards = flashcards
+    st.session_state.current_index = 0
+    st.session_state.cards_generated += len(flashcards)
+    st.session_state.texts_processed += 1
+    st.session_state.text_word_count = len(source_text.split())
+    st.session_state.flashcard_word_count = get_flashcard_word_count(flashcards)
+    st.session_state.card_flipped = False
+
 # --- Header
 st.markdown('<h1 class="main-header">🫠 Smart Flashcard Generator</h1>', unsafe_allow_html=True)
 
@@ -75,6 +115,34 @@ with st.sidebar:
         </div>
     """, unsafe_allow_html=True)
 
+    with st.expander("Model stats"):
+        model_stats = registry.stats()
+        for name, entry in model_stats["models"].items():
+            if entry["loaded"]:
+                st.caption(f"{name}: loaded in {entry['load_time_s']:.2f}s, ~{entry['memory_mb']:.0f} MB")
+            else:
+                st.caption(f"{name}: not loaded")
+        st.caption(f"Process memory: {model_stats['process_rss_mb']:.0f} MB")
+
+    if deck_store is not None:
+        with st.expander("Deck library"):
+            library = deck_store.stats()
+            st.caption(f"{library['decks']} decks, {library['cards']} cards from {library['words']} words")
+            library_query = st.text_input("Search saved cards", key="library_query")
+            if library_query.strip():
+                matches = deck_store.search(library_query)
+                if not matches:
+                    st.caption("No matching cards.")
+                for match in matches:
+                    st.caption(f"{match['name']} ({match['source'] or 'deck ' + str(match['deck_id'])}): "
+                               f"{match['text']}")
+
+    if st.session_state.last_timings:
+        with st.expander("Last run timings"):
+            for stage, timing in st.session_state.last_timings.items():
+                calls = f" ({timing['calls']} calls)" if timing["calls"] > 1 else ""
+                st.caption(f"{stage}: {timing['seconds'] * 1000:.0f} ms{calls}")
+
 # --- Main Layout
 col1, col2 = st.columns([2, 3])
 
@@ -90,19 +158,8 @@ with col1:
 
             if submit_button:
                 if text_input.strip():
-                    with st.spinner("Generating flashcards..."):
-                        flashcards = generate_flashcards(text_input)
-                        if flashcards:
-                            st.session_state.flashcards = flashcards
-                            st.session_state.current_index = 0
-                            st.session_state.cards_generated += len(flashcards)
-                            st.session_state.texts_processed += 1
-                            st.session_state.text_word_count = len(text_input.split())
-                            st.session_state.flashcard_word_count = get_flashcard_word_count(flashcards)
-                            st.session_state.card_flipped = False
-                            st.success(f"Generated {len(flashcards)} flashcards!")
-                        else:
-                            st.error("Flashcard generation failed.")
+                    # Runs on the shared worker pool; reruns of this script just poll it
+                    st.session_state.job_id = submit_generation(text_input, st.session_state.incremental_deck)
                 else:
                     st.warning("Please enter some text!")
 
@@ -112,35 +169,62 @@ with col1:
 
             if submit_button:
                 if uploaded_file:
-                    with st.spinner("Processing image..."):
-                        image_path = f"temp_{uploaded_file.name}"
-                        with open(image_path, "wb") as f:
-                            f.write(uploaded_file.getbuffer())
-
-                        extracted_text = extract_text(image_path)
-                        os.remove(image_path)
-
-                        if extracted_text:
-                            preview = extracted_text[:200] + ("..." if len(extracted_text) > 200 else "")
-                            st.text_area("Extracted text:", value=preview, height=100, disabled=True)
-
-                            flashcards = generate_flashcards(extracted_text)
-                            if flashcards:
-                                st.session_state.flashcards = flashcards
-                                st.session_state.current_index = 0
-                                st.session_state.cards_generated += len(flashcards)
-                                st.session_state.texts_processed += 1
-                                st.session_state.text_word_count = len(extracted_text.split())
-                                st.session_state.flashcard_word_count = get_flashcard_word_count(flashcards)
-                                st.session_state.card_flipped = False
-                                st.success(f"Generated {len(flashcards)} flashcards!")
-                            else:
-                                st.error("Flashcard generation failed.")
-                        else:
-                            st.error("No text could be extracted from the image.")
+                    # The upload's bytes are handed to the worker; no temp file
+                    st.session_state.job_id = submit_image_generation(uploaded_file.getvalue())
                 else:
                     st.warning("Please upload an image!")
 
+    # --- Background job status
+    job_running = False
+    if st.session_state.job_id:
+        job = job_queue.get(st.session_state.job_id)
+        if job is None:
+            st.session_state.job_id = None
+            st.error("The generation job expired. Please submit again.")
+        else:
+            job_state = job.snapshot()
+            if job_state["status"] in ("queued", "running"):
+                job_running = True
+                st.progress(job_state["progress"], text=job_state["message"] or "Waiting for a free worker...")
+                for name, card in job_state["partial"].items():
+                    st.caption(f"{name}: {card}")
+            else:
+                st.session_state.job_id = None
+                st.session_state.last_timings = job_state["timings"]
+                result = job_state["result"] or {}
+                if job_state["status"] == "failed":
+                    st.error("Flashcard generation failed.")
+                elif job_state["kind"] == "ocr" and not result.get("text"):
+                    st.error("No text could be extracted from the image.")
+                else:
+                    if job_state["kind"] == "ocr":
+                        extracted_text = result["text"]
+                        preview = extracted_text[:200] + ("..." if len(extracted_text) > 200 else "")
+                        st.text_area("Extracted text:", value=preview, height=100, disabled=True)
+                    flashcards = result.get("flashcards")
+                    if flashcards:
+                        apply_deck(flashcards, result["text"])
+                        if result.get("stored"):
+                            st.success(f"Loaded {len(flashcards)} flashcards from the deck library!")
+                        else:
+                            st.success(f"Generated {len(flashcards)} flashcards!")
+                    else:
+                        st.error("Flashcard generation failed.")
+
+    # --- Semantic search over every stored card
+    if card_index is not None:
+        st.markdown("### 🔎 Search your cards")
+        search_query = st.text_input("Find cards about...", key="semantic_query",
+                                     placeholder="e.g. photosynthesis")
+        if search_query.strip():
+            results = search_cards(search_query, k=10)
+            if not results:
+                st.caption("No cards found. Generate some decks first!")
+            for result in results:
+                st.markdown(f"**{result['name']}** · {result['source'] or 'deck ' + str(result['deck_id'])} "
+                            f"· {result['score']:.2f}")
+                st.caption(result["text"])
+
 # --- Flashcard Display
 with col2:
     if st.session_state.flashcards:
@@ -192,10 +276,7 @@ with col2:
                 # st.rerun()  # Added rerun to make flip effect more responsive
 
         with col_audio:
-            if st.button("🔊 Read Aloud"):
-                with st.spinner("Converting to speech..."):
-                    text_to_speech(values[current_index])
-                    st.success("Audio saved")
+            read_aloud = st.button("🔊 Read Aloud")
 
         with col_next:
             if st.button("Next ➡️", disabled=current_index == len(flashcards) - 1):
@@ -203,6 +284,16 @@ with col2:
                 st.session_state.card_flipped = False
                 st.rerun()
 
+        if read_aloud:
+            with st.spinner("Converting to speech..."):
+                try:
+                    st.audio(synthesize_async(values[current_index]).result(), format=audio_mime_type())
+                except Exception as e:
+                    st.error(f"Speech synthesis failed: {e}")
+
+        # Warm the audio cache for the upcoming cards so "Read Aloud" is instant
+        prefetch(values[current_index:current_index + AUDIO_PREFETCH + 1])
+
     else:
         st.markdown("""
             <div class="empty-state">
@@ -217,4 +308,9 @@ st.markdown("""
         Smart Flashcard Generator • Powered by AI<br>
         © Chinmay Keripale, Asim Kazi & Aditya Kulkarni
     </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+# Keep polling while a background job is running; widgets stay responsive in between
+if job_running:
+    time.sleep(JOB_POLL_SECONDS)
+    st.rerun()
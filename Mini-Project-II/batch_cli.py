@@ -0,0 +1,204 @@
+""" Generate flashcard decks for a whole directory of notes and images
+
+Usage: python batch_cli.py INPUT_DIR OUTPUT_DIR [--workers 4] [--formats json csv anki] [--audio]
+
+Walks INPUT_DIR for .txt/.md/.png/.jpg/.jpeg files, processes them across a
+pool of worker processes (each loading the models once) and writes one deck
+per document under OUTPUT_DIR, mirroring the input layout. Outputs keep the
+source extension (notes.txt -> notes.txt.json), so notes.txt and notes.png
+in one folder get separate decks. Finished files are recorded in
+OUTPUT_DIR/.batch_manifest.jsonl, so re-running after a crash skips them
+unless the source changed (use --no-resume to redo everything).
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from flashcard import generate_flashcards, preprocess_text, warm_up_models
+from image_processing import extract_text
+from text_to_speech import DEFAULT_ENGINE, ENGINES, render_deck_audio
+
+TEXT_EXTENSIONS = {".txt", ".md"}
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+MANIFEST_NAME = ".batch_manifest.jsonl"
+FORMATS = ("json", "csv", "anki")
+
+
+def find_documents(input_dir):
+    documents = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in TEXT_EXTENSIONS | IMAGE_EXTENSIONS:
+                documents.append(os.path.join(root, name))
+    return documents
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def strip_markdown(text):
+    """ Drop markdown syntax that would otherwise end up inside cards """
+    text = re.sub(r"```.*?```", " ", text, flags=re.S)
+    text = re.sub(r"!?\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    text = re.sub(r"^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+", "", text, flags=re.M)
+    return re.sub(r"[*_`]{1,3}", "", text)
+
+
+def read_document(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return extract_text(path)
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    return strip_markdown(text) if extension == ".md" else text
+
+
+def write_deck(flashcards, base_path, source, formats):
+    os.makedirs(os.path.dirname(base_path), exist_ok=True)
+    written = []
+    if "json" in formats:
+        with open(base_path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"source": source, "flashcards": flashcards}, f, indent=2, ensure_ascii=False)
+        written.append(base_path + ".json")
+    if "csv" in formats:
+        with open(base_path + ".csv", "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["card", "text"])
+            writer.writerows(flashcards.items())
+        written.append(base_path + ".csv")
+    if "anki" in formats:
+        # Anki's plain-text import: one note per line, front<TAB>back, with a tag column
+        tag = re.sub(r"\W+", "_", os.path.splitext(os.path.basename(source))[0])
+        with open(base_path + ".anki.txt", "w", encoding="utf-8") as f:
+            f.write("#separator:tab\n#html:false\n#tags column:3\n")
+            for name, text in flashcards.items():
+                front = f"{os.path.basename(source)} - {name}"
+                f.write("\t".join(value.replace("\t", " ").replace("\n", " ")
+                                  for value in (front, text, tag)) + "\n")
+        written.append(base_path + ".anki.txt")
+    return written
+
+
+def _init_worker():
+    # One model instance per worker process, loaded before the first document
+    warm_up_models()
+
+
+def process_document(path, input_dir, output_dir, formats, audio):
+    """ Worker: read/OCR one document, generate its deck and write the exports """
+    start = time.perf_counter()
+    text = read_document(path)
+    sentences = preprocess_text(text) if text.strip() else []
+    flashcards = generate_flashcards(text, sentences=sentences) if sentences else {}
+
+    relative = os.path.relpath(path, input_dir)
+    # Keep the source extension: notes.txt and notes.png in one folder must not share outputs
+    base_path = os.path.join(output_dir, relative)
+    outputs = write_deck(flashcards, base_path, relative, formats) if flashcards else []
+    if audio and flashcards:
+        audio_path = f"{base_path}.{ENGINES[DEFAULT_ENGINE].format}"
+        render_deck_audio(flashcards, output_path=audio_path)
+        outputs.append(audio_path)
+
+    return {
+        "path": relative,
+        "words": len(text.split()),
+        "sentences": len(sentences),
+        "cards": len(flashcards),
+        "outputs": outputs,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def load_manifest(path):
+    finished = {}
+    if not os.path.exists(path):
+        return finished
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # partially written line from a crash
+            if entry.get("status") == "done":
+                finished[entry["path"]] = entry["sha1"]
+    return finished
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="worker processes, each with its own model instance")
+    parser.add_argument("--formats", nargs="+", default=["json"], choices=FORMATS)
+    parser.add_argument("--audio", action="store_true", help="also render one audio track per deck")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="reprocess files already recorded as finished")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_path = os.path.join(args.output_dir, MANIFEST_NAME)
+    finished = load_manifest(manifest_path) if args.resume else {}
+
+    pending = []
+    skipped = 0
+    for path in find_documents(args.input_dir):
+        relative = os.path.relpath(path, args.input_dir)
+        sha1 = file_digest(path)
+        if finished.get(relative) == sha1:
+            skipped += 1
+        else:
+            pending.append((path, relative, sha1))
+    print(f"{len(pending)} documents to process, {skipped} already done")
+    if not pending:
+        return 0
+
+    totals = {"docs": 0, "failed": 0, "sentences": 0, "cards": 0}
+    start = time.perf_counter()
+    with open(manifest_path, "a", encoding="utf-8") as manifest, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(process_document, path, args.input_dir, args.output_dir,
+                               args.formats, args.audio): (relative, sha1)
+                   for path, relative, sha1 in pending}
+        for future in as_completed(futures):
+            relative, sha1 = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                totals["failed"] += 1
+                print(f"Error processing {relative}: {e}")
+                manifest.write(json.dumps({"path": relative, "sha1": sha1, "status": "failed",
+                                           "error": str(e)}) + "\n")
+                manifest.flush()
+                continue
+            totals["docs"] += 1
+            totals["sentences"] += result["sentences"]
+            totals["cards"] += result["cards"]
+            manifest.write(json.dumps({"path": relative, "sha1": sha1, "status": "done",
+                                       "cards": result["cards"]}) + "\n")
+            manifest.flush()
+            print(f"[{totals['docs'] + totals['failed']}/{len(pending)}] {relative}: "
+                  f"{result['cards']} cards from {result['sentences']} sentences in {result['seconds']:.1f}s")
+
+    elapsed = time.perf_counter() - start
+    print(f"Processed {totals['docs']} documents ({totals['failed']} failed) in {elapsed:.1f}s: "
+          f"{totals['docs'] / elapsed:.2f} docs/sec, {totals['sentences'] / elapsed:.1f} sentences/sec, "
+          f"{totals['cards']} cards")
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
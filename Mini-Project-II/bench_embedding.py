@@ -0,0 +1,125 @@
+""" Compare embedding backends and storage dtypes on speed, memory and ranking agreement
+
+Usage: python bench_embedding.py [--words 5000] [--backends torch onnx onnx-int8] [--min-overlap 0.8]
+
+Every backend runs in a fresh process and is checked against fp32 PyTorch:
+mean cosine similarity of the sentence vectors, and overlap of the top-k
+PageRank sentences (which decides the cards). The same check is applied to
+vectors round-tripped through the float16/int8 cache storage. Exits non-zero
+if any top-k overlap falls below --min-overlap.
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+from bench_segmentation import GOLD_SENTENCES
+from benchmark import synthetic_corpus
+
+
+def build_sentences(words):
+    """ The hand-written study sentences followed by distinct synthetic ones, about words long
+
+    Every sentence is different, so the top-k overlap compares real ranking
+    decisions rather than ties between copies of the same sentence.
+    """
+    sentences = list(GOLD_SENTENCES)
+    remaining = words - len(" ".join(sentences).split())
+    if remaining > 0:
+        text = synthetic_corpus(remaining)
+        sentences += [s.strip() + "." for s in text.replace("\n\n", " ").split(".") if s.strip()]
+    return list(dict.fromkeys(sentences))
+
+
+def top_k_overlap(scores_a, scores_b, k):
+    top_a = set(np.argsort(-np.asarray(scores_a))[:k])
+    top_b = set(np.argsort(-np.asarray(scores_b))[:k])
+    return len(top_a & top_b) / k
+
+
+def run_backend(backend, sentences):
+    # Imported in the worker so each backend is measured in a fresh process
+    from flashcard import encode_sentences, load_embedder
+    from model_registry import resident_memory_mb
+
+    rss_start = resident_memory_mb()
+    start = time.perf_counter()
+    model = load_embedder(backend)
+    load_time = time.perf_counter() - start
+    rss_loaded = resident_memory_mb()
+
+    encode_sentences(model, sentences[:8])  # first call pays for lazy initialisation
+    start = time.perf_counter()
+    embeddings = np.asarray(encode_sentences(model, sentences), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+    return {
+        "backend": backend,
+        "model": type(model).__name__,
+        "load_time_s": round(load_time, 3),
+        "model_memory_mb": round(rss_loaded - rss_start, 1),
+        "sentences_per_sec": round(len(sentences) / elapsed, 1) if elapsed else 0.0,
+        "embeddings": embeddings.tolist(),
+    }
+
+
+def agreement(reference, embeddings, k):
+    from ranking import normalize_rows, rank_sentences
+
+    cosine = float(np.mean(np.sum(normalize_rows(reference) * normalize_rows(embeddings), axis=1)))
+    overlap = top_k_overlap(rank_sentences(reference), rank_sentences(embeddings), k)
+    return {"mean_cosine": round(cosine, 5), "top_k_overlap": round(overlap, 3)}
+
+
+def main():
+    from embedding_cache import pack_vector, unpack_vector
+    from flashcard import EMBEDDING_BACKENDS
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=5000)
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--min-overlap", type=float, default=0.8)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    sentences = build_sentences(args.words)
+    k = min(args.top_k, len(sentences))
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        with ctx.Pool(1) as pool:
+            try:
+                results.append(pool.apply(run_backend, (backend, sentences)))
+            except Exception as e:
+                print(f"{backend:12s} skipped ({e})")
+    if not results or results[0]["backend"] != "torch":
+        print("fp32 reference backend unavailable")
+        return 1
+
+    reference = np.asarray(results[0]["embeddings"], dtype=np.float32)
+    failed = False
+    rows = [(r["backend"], r, np.asarray(r.pop("embeddings"), dtype=np.float32)) for r in results]
+    for dtype in ("float16", "int8"):
+        stored = np.stack([unpack_vector(pack_vector(v, dtype)) for v in reference])
+        rows.append((f"torch/{dtype}", {"backend": "torch", "storage": dtype}, stored))
+
+    for label, result, embeddings in rows:
+        result.update(agreement(reference, embeddings, k))
+        failed |= result["top_k_overlap"] < args.min_overlap
+        speed = f"{result['sentences_per_sec']:>10.1f} sent/s  load {result['load_time_s']:.2f}s  " \
+                f"model {result['model_memory_mb']:.0f} MB  " if "sentences_per_sec" in result else " " * 46
+        print(f"{label:16s} {speed}cosine {result['mean_cosine']:.4f}  top-{k} overlap {result['top_k_overlap']:.2f}")
+        if label != result["backend"]:
+            results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
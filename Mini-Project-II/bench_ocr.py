@@ -0,0 +1,188 @@
+""" Compare OCR backends (persistent tesserocr engines vs pytesseract subprocesses)
+
+Usage: python bench_ocr.py [--images 20] [--repeat 3] [--backends tesserocr pytesseract]
+       python bench_ocr.py --pipeline [--images 10] [--scale 3]
+
+--pipeline instead compares full-resolution, whole-page OCR against adaptive
+downscaling + text-region cropping on large photographed-page-sized images.
+"""
+import argparse
+import difflib
+import json
+import time
+
+import cv2
+import numpy as np
+
+SAMPLE_LINES = [
+    "Photosynthesis converts light energy into chemical energy.",
+    "It takes place mainly in the chloroplasts of plant cells.",
+    "The light reactions produce ATP and NADPH for the Calvin cycle.",
+    "Cellular respiration reverses the process and releases energy.",
+    "Glycolysis happens in the cytoplasm of every living cell.",
+    "Momentum is conserved in any closed system of objects.",
+    "A force applied to a mass produces an acceleration.",
+    "Enzymes lower the activation energy of chemical reactions.",
+]
+
+
+def make_text_image(lines, scale=1.0, noise=8, seed=0):
+    """ Render lines of black text on a lightly noisy white page, like a scanned note """
+    line_height = int(40 * scale)
+    width = int(1200 * scale)
+    height = line_height * (len(lines) + 2)
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    for i, line in enumerate(lines):
+        cv2.putText(page, line, (int(30 * scale), line_height * (i + 2)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9 * scale, (0, 0, 0), max(1, int(2 * scale)), cv2.LINE_AA)
+    if noise:
+        rng = np.random.default_rng(seed)
+        jitter = rng.integers(-noise, noise + 1, size=page.shape)
+        page = np.clip(page.astype(np.int16) + jitter, 0, 255).astype(np.uint8)
+    return page
+
+
+def make_image_set(count, scale=1.0):
+    """ Fixed, reproducible set of (image, ground_truth_text) pairs """
+    images = []
+    for i in range(count):
+        lines = [SAMPLE_LINES[(i + j) % len(SAMPLE_LINES)] for j in range(4)]
+        images.append((make_text_image(lines, scale=scale, seed=i), "\n".join(lines)))
+    return images
+
+
+def make_photo_set(count, scale=3.0):
+    """ Large pages with a couple of text blocks and lots of margin, like phone photos of notes """
+    pages = []
+    for img, expected in make_image_set(count, scale=scale):
+        height, width = img.shape[:2]
+        page = np.full((height * 4, int(width * 1.3), 3), 235, dtype=np.uint8)
+        page[height // 2:height // 2 + height, width // 10:width // 10 + width] = img
+        pages.append((page, expected))
+    return pages
+
+
+def text_accuracy(predicted, expected):
+    """ Character-level similarity ratio between OCR output and ground truth """
+    return difflib.SequenceMatcher(None, " ".join(predicted.split()), " ".join(expected.split())).ratio()
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def bench_backend(name, images, repeat):
+    from image_processing import load_ocr_backend, preprocess_image
+
+    start = time.perf_counter()
+    backend = load_ocr_backend(name)
+    setup_time = time.perf_counter() - start
+
+    processed = [(preprocess_image(img), expected) for img, expected in images]
+    latencies, accuracies = [], []
+    for _ in range(repeat):
+        for img, expected in processed:
+            start = time.perf_counter()
+            text = backend.image_to_string(img)
+            latencies.append(time.perf_counter() - start)
+            accuracies.append(text_accuracy(text, expected))
+    backend.close()
+
+    total = sum(latencies)
+    return {
+        "backend": name,
+        "setup_s": round(setup_time, 3),
+        "images": len(latencies),
+        "images_per_sec": round(len(latencies) / total, 2) if total else 0.0,
+        "latency_ms": {
+            "mean": round(1000 * total / len(latencies), 2),
+            "p50": round(1000 * percentile(latencies, 50), 2),
+            "p95": round(1000 * percentile(latencies, 95), 2),
+        },
+        "accuracy": round(float(np.mean(accuracies)), 4),
+    }
+
+
+PIPELINES = {
+    "full-resolution": {"target_text_height": None, "detect_regions": False},
+    "adaptive": {"target_text_height": 30, "detect_regions": True},
+}
+
+
+def bench_pipeline(label, images, repeat):
+    import image_processing
+
+    saved = dict(image_processing.PREPROCESS_PARAMS)
+    image_processing.PREPROCESS_PARAMS.update(PIPELINES[label])
+    try:
+        pre_times, ocr_times, accuracies = [], [], []
+        for _ in range(repeat):
+            for img, expected in images:
+                start = time.perf_counter()
+                processed = image_processing.preprocess_image(img)
+                preprocessed = time.perf_counter()
+                text = image_processing.ocr_image(processed)
+                pre_times.append(preprocessed - start)
+                ocr_times.append(time.perf_counter() - preprocessed)
+                accuracies.append(text_accuracy(text, expected))
+    finally:
+        image_processing.PREPROCESS_PARAMS.clear()
+        image_processing.PREPROCESS_PARAMS.update(saved)
+
+    total = sum(pre_times) + sum(ocr_times)
+    return {
+        "pipeline": label,
+        "images": len(pre_times),
+        "images_per_sec": round(len(pre_times) / total, 2) if total else 0.0,
+        "preprocess_ms_p50": round(1000 * percentile(pre_times, 50), 2),
+        "ocr_ms_p50": round(1000 * percentile(ocr_times, 50), 2),
+        "accuracy": round(float(np.mean(accuracies)), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backends", nargs="+", default=["tesserocr", "pytesseract"],
+                        choices=["tesserocr", "pytesseract"])
+    parser.add_argument("--pipeline", action="store_true",
+                        help="compare preprocessing pipelines instead of backends")
+    parser.add_argument("--scale", type=float, default=3.0, help="page scale for --pipeline")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    if args.pipeline:
+        pages = make_photo_set(args.images, scale=args.scale)
+        print(f"{len(pages)} pages of {pages[0][0].shape[1]}x{pages[0][0].shape[0]} px")
+        for label in PIPELINES:
+            result = bench_pipeline(label, pages, args.repeat)
+            results.append(result)
+            print(f"{label:16s} {result['images_per_sec']:>8.2f} img/s  "
+                  f"preprocess p50 {result['preprocess_ms_p50']:.1f} ms  "
+                  f"ocr p50 {result['ocr_ms_p50']:.1f} ms  accuracy {result['accuracy']:.3f}")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+        return
+
+    images = make_image_set(args.images)
+    for name in args.backends:
+        try:
+            result = bench_backend(name, images, args.repeat)
+        except ImportError as e:
+            print(f"{name:12s} skipped ({e})")
+            continue
+        results.append(result)
+        lat = result["latency_ms"]
+        print(f"{name:12s} {result['images_per_sec']:>8.2f} img/s  mean {lat['mean']:.1f} ms  "
+              f"p50 {lat['p50']:.1f} ms  p95 {lat['p95']:.1f} ms  accuracy {result['accuracy']:.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
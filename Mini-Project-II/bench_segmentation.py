@@ -0,0 +1,129 @@
+""" Compare sentence segmentation modes on speed, memory and boundary accuracy
+
+Usage: python bench_segmentation.py [--words 20000] [--n-process 1] [--modes parser sentencizer]
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+
+# Fixed corpus with hand-checked sentence boundaries, including abbreviations,
+# decimals and quotes that trip up naive punctuation splitting.
+GOLD_SENTENCES = [
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "It takes place mainly in the chloroplasts of plant cells.",
+    "Dr. Calvin mapped the carbon fixation cycle in the 1950s.",
+    "The light reactions produce ATP and NADPH, e.g. for use in the Calvin cycle.",
+    "Roughly 0.1% of incoming sunlight is captured by plants worldwide.",
+    "Why does this matter?",
+    "Nearly all food chains depend on it.",
+    "Cellular respiration reverses the process and releases energy.",
+    "Glycolysis happens in the cytoplasm, while the Krebs cycle runs in the mitochondria.",
+    "The electron transport chain yields about 34 ATP per glucose molecule.",
+    "\"Energy is neither created nor destroyed,\" as the first law of thermodynamics states.",
+    "Enzymes such as rubisco catalyse these reactions at body or leaf temperature.",
+    "Newton's laws describe how forces change the motion of objects.",
+    "A force of 10 N applied to a 2 kg mass gives an acceleration of 5 m/s^2.",
+    "The U.S. space program relied on these principles for orbital mechanics.",
+    "Momentum is conserved in any closed system.",
+]
+
+
+def gold_text():
+    return " ".join(GOLD_SENTENCES)
+
+
+def build_corpus(words):
+    text = gold_text()
+    repeats = max(1, words // len(text.split()))
+    # Paragraph breaks every repeat, like pasted notes
+    return ["\n\n".join([text] * 10) for _ in range(max(1, repeats // 10))]
+
+
+def boundary_scores(predicted, gold):
+    """ Precision/recall/F1 of sentence start offsets against the gold segmentation """
+    def starts(sentences):
+        offsets, pos = set(), 0
+        for sentence in sentences:
+            offsets.add(pos)
+            pos += len(sentence.replace(" ", ""))
+        return offsets
+
+    pred_starts, gold_starts = starts(predicted), starts(gold)
+    true_positive = len(pred_starts & gold_starts)
+    precision = true_positive / len(pred_starts) if pred_starts else 0.0
+    recall = true_positive / len(gold_starts) if gold_starts else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def peak_rss_mb():
+    """ Peak resident set size of this process so far (ru_maxrss), or None where unavailable """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def run_mode(mode, words, n_process):
+    # Imported in the worker so each mode is measured in a fresh process
+    from flashcard import load_spacy
+    from model_registry import resident_memory_mb
+
+    rss_start = resident_memory_mb()
+    start = time.perf_counter()
+    nlp = load_spacy(mode)
+    load_time = time.perf_counter() - start
+    rss_loaded = resident_memory_mb()
+
+    corpus = build_corpus(words)
+    start = time.perf_counter()
+    sentence_count = 0
+    for doc in nlp.pipe(corpus, n_process=n_process, batch_size=4):
+        sentence_count += sum(1 for sent in doc.sents if sent.text.strip())
+    elapsed = time.perf_counter() - start
+
+    predicted = [sent.text.strip() for sent in nlp(gold_text()).sents if sent.text.strip()]
+    return {
+        "mode": mode,
+        "load_time_s": round(load_time, 3),
+        "model_memory_mb": round(rss_loaded - rss_start, 1),
+        # High-water mark of the whole worker process (n_process > 1 children not included)
+        "peak_memory_mb": peak_rss_mb(),
+        "sentences": sentence_count,
+        "sentences_per_sec": round(sentence_count / elapsed, 1) if elapsed else 0.0,
+        "accuracy": {k: round(v, 3) for k, v in boundary_scores(predicted, GOLD_SENTENCES).items()},
+    }
+
+
+def main():
+    from flashcard import SEGMENTER_MODES
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, default=20000)
+    parser.add_argument("--n-process", type=int, default=1)
+    parser.add_argument("--modes", nargs="+", default=list(SEGMENTER_MODES), choices=SEGMENTER_MODES)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for mode in args.modes:
+        with ctx.Pool(1) as pool:
+            result = pool.apply(run_mode, (mode, args.words, args.n_process))
+        results.append(result)
+        acc = result["accuracy"]
+        print(f"{mode:12s} {result['sentences_per_sec']:>10.1f} sent/s  "
+              f"load {result['load_time_s']:.2f}s  model {result['model_memory_mb']:.0f} MB  "
+              f"peak {result['peak_memory_mb'] or 0:.0f} MB  boundary F1 {acc['f1']:.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+""" End-to-end benchmark of the OCR, segmentation, embedding, ranking and TTS stages
+
+Usage: python benchmark.py [--sizes 100 1000 10000 100000] [--repeat 5] [--output results.json]
+       python benchmark.py --compare old.json new.json
+
+Runs offline: speech synthesis goes through a stub engine instead of gTTS and
+the Hugging Face hub is put in offline mode, so models must already be cached.
+Results (per-stage latency percentiles, throughput and peak RSS, plus the git
+commit) are saved as JSON so runs from different commits can be compared.
+The text suite first runs check_incremental and exits non-zero if it fails.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import wave
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import numpy as np
+
+from bench_ocr import make_image_set
+from bench_segmentation import GOLD_SENTENCES
+from model_registry import registry, resident_memory_mb
+
+WORDS = ("cell energy force mass light plant enzyme reaction system molecule process "
+         "structure membrane protein carbon oxygen water heat motion wave current field "
+         "charge atom nucleus electron theory model data signal pattern function").split()
+
+
+def synthetic_corpus(words, seed=0):
+    """ Deterministic pseudo-prose with sentences of 8-25 words and paragraph breaks """
+    rng = random.Random(seed)
+    sentences, count = [], 0
+    while count < words:
+        length = rng.randint(8, 25)
+        sentence = " ".join(rng.choice(WORDS) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        count += length
+    paragraphs = [" ".join(sentences[i:i + 6]) for i in range(0, len(sentences), 6)]
+    return "\n\n".join(paragraphs)
+
+
+def fixed_corpus(words):
+    """ The hand-written study text, repeated up to the requested size """
+    text = " ".join(GOLD_SENTENCES)
+    repeats = max(1, words // len(text.split()))
+    return "\n\n".join([text] * repeats)
+
+
+class StubSpeechEngine:
+    """ Offline stand-in for network TTS: returns silence proportional to text length """
+    name = "benchmark-stub"
+    format = "wav"
+
+    def synthesize(self, text, lang):
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(16000)
+            writer.writeframes(b"\0\0" * 160 * len(text))
+        return buffer.getvalue()
+
+
+def measure(fn, repeat):
+    """ Run fn repeat times; returns (latencies, last result) """
+    latencies, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies, result
+
+
+def summarize(latencies, items=None, unit="items"):
+    ms = np.asarray(latencies) * 1000
+    summary = {
+        "runs": len(latencies),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "rss_mb": round(resident_memory_mb(), 1),
+    }
+    if items:
+        summary[f"{unit}_per_sec"] = round(items / (float(np.median(latencies)) or 1e-9), 1)
+    return summary
+
+
+def run_stage(results, name, fn, repeat, items=None, unit="items"):
+    try:
+        latencies, output = measure(fn, repeat)
+    except Exception as e:
+        results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+        print(f"  {name:24s} skipped ({e})")
+        return None
+    results[name] = summarize(latencies, items, unit)
+    rate = results[name].get(f"{unit}_per_sec")
+    print(f"  {name:24s} p50 {results[name]['p50_ms']:>10.2f} ms  p95 {results[name]['p95_ms']:>10.2f} ms"
+          + (f"  {rate:>10.1f} {unit}/s" if rate else ""))
+    return output
+
+
+def bench_text(corpus_name, text, repeat):
+    from flashcard import (MODEL_NAME, determine_flashcard_count, encode_sentences, get_embedder,
+                           preprocess_text, select_flashcards)
+    from ranking import rank_sentences
+
+    results = {"words": len(text.split())}
+    print(f"{corpus_name}: {results['words']} words")
+    sentences = run_stage(results, "segmentation", lambda: preprocess_text(text), repeat,
+                          items=results["words"], unit="words")
+    if not sentences:
+        return results
+    results["sentences"] = len(sentences)
+
+    model = get_embedder()
+    # Encoder called directly so the embedding cache does not hide the cost
+    embeddings = run_stage(results, "embedding", lambda: np.asarray(encode_sentences(model, sentences)),
+                           max(1, repeat // 2), items=len(sentences), unit="sentences")
+    if embeddings is None:
+        return results
+    results["embedding"]["model"] = MODEL_NAME
+
+    scores = run_stage(results, "ranking", lambda: rank_sentences(embeddings), repeat,
+                       items=len(sentences), unit="sentences")
+    if len(sentences) <= 2000:
+        run_stage(results, "ranking_dense_networkx", lambda: _legacy_rank(embeddings), max(1, repeat // 2),
+                  items=len(sentences), unit="sentences")
+    if scores is not None:
+        count = determine_flashcard_count(text)
+        run_stage(results, "selection", lambda: select_flashcards(sentences, scores, count, embeddings=embeddings),
+                  repeat)
+        run_stage(results, "selection_rank_order", lambda: select_flashcards(sentences, scores, count, diversity=0),
+                  repeat)
+    return results
+
+
+def check_incremental():
+    """ Edge cases the session's IncrementalDeck must handle like generate_flashcards; returns failures """
+    import dedupe
+    from incremental import IncrementalDeck
+
+    cases = [("single sentence", GOLD_SENTENCES[0], None),
+             ("dedupe off", " ".join(GOLD_SENTENCES), 0.0)]
+    failures = []
+    saved = dedupe.DEDUPE_THRESHOLD
+    for label, text, threshold in cases:
+        dedupe.DEDUPE_THRESHOLD = saved if threshold is None else threshold
+        try:
+            deck = IncrementalDeck()
+            if not deck.generate(text) or not deck.generate(text + "\n\n" + GOLD_SENTENCES[-1]):
+                failures.append(f"{label}: no cards")
+        except Exception as e:
+            failures.append(f"{label}: {type(e).__name__}: {e}")
+        finally:
+            dedupe.DEDUPE_THRESHOLD = saved
+    print(f"incremental checks: {len(cases) - len(failures)}/{len(cases)} passed")
+    for failure in failures:
+        print(f"  FAILED {failure}")
+    return failures
+
+
+def _legacy_rank(embeddings):
+    """ The original dense cosine matrix + networkx PageRank, for comparison """
+    import networkx as nx
+    from sklearn.metrics.pairwise import cosine_similarity
+    return nx.pagerank(nx.from_numpy_array(cosine_similarity(embeddings)))
+
+
+def bench_ocr(image_count, repeat):
+    from image_processing import ocr_image, preprocess_image
+
+    images = [img for img, _ in make_image_set(image_count)]
+    results = {"images": len(images)}
+    print(f"ocr: {len(images)} generated pages")
+    processed = run_stage(results, "ocr_preprocess", lambda: [preprocess_image(img) for img in images],
+                          repeat, items=len(images), unit="images")
+    if processed:
+        run_stage(results, "ocr_tesseract", lambda: [ocr_image(img) for img in processed],
+                  max(1, repeat // 2), items=len(images), unit="images")
+    return results
+
+
+def bench_tts(card_count, repeat):
+    import text_to_speech
+
+    registry.register(f"tts:{StubSpeechEngine.name}", StubSpeechEngine)
+    text_to_speech.ENGINES[StubSpeechEngine.name] = StubSpeechEngine
+    cards = {f"Point {i + 1}": sentence for i, sentence in enumerate(GOLD_SENTENCES[:card_count])}
+    results = {"cards": len(cards), "engine": StubSpeechEngine.name}
+    print(f"tts: {len(cards)} cards (stub engine)")
+
+    def render():
+        # Fresh cache each run so every card is synthesized
+        text_to_speech.audio_cache = text_to_speech.AudioCache()
+        return text_to_speech.render_deck_audio(cards, engine=StubSpeechEngine.name)
+
+    run_stage(results, "tts_deck", render, repeat, items=len(cards), unit="cards")
+    run_stage(results, "tts_cached", lambda: text_to_speech.render_deck_audio(cards, engine=StubSpeechEngine.name),
+              repeat, items=len(cards), unit="cards")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+    except ImportError:
+        return None
+
+
+def compare(old_path, new_path, threshold=0.10):
+    """ Print p50 changes between two result files, flagging regressions over threshold """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{(old.get('commit') or '?')[:10]} -> {(new.get('commit') or '?')[:10]}")
+    regressions = 0
+    for suite, stages in new["suites"].items():
+        for stage, result in stages.items():
+            before = old.get("suites", {}).get(suite, {}).get(stage)
+            if not isinstance(result, dict) or not isinstance(before, dict):
+                continue
+            if "p50_ms" not in result or "p50_ms" not in before or not before["p50_ms"]:
+                continue
+            change = (result["p50_ms"] - before["p50_ms"]) / before["p50_ms"]
+            flag = "  REGRESSION" if change > threshold else ""
+            regressions += bool(flag)
+            print(f"{suite:16s} {stage:24s} {before['p50_ms']:>10.2f} -> {result['p50_ms']:>10.2f} ms "
+                  f"({change:+.1%}){flag}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1000, 10000, 100000],
+                        help="corpus sizes in words")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--cards", type=int, default=10)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["text", "ocr", "tts"])
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two saved result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+
+    suites = {}
+    failures = []
+    if "text" not in args.skip:
+        failures += check_incremental()
+        for size in args.sizes:
+            # Fewer repeats on the largest inputs keeps the run practical
+            repeat = max(1, args.repeat if size <= 10000 else args.repeat // 2)
+            suites[f"synthetic_{size}"] = bench_text(f"synthetic_{size}", synthetic_corpus(size), repeat)
+            suites[f"fixed_{size}"] = bench_text(f"fixed_{size}", fixed_corpus(size), repeat)
+    if "ocr" not in args.skip:
+        suites["ocr"] = bench_ocr(args.images, args.repeat)
+    if "tts" not in args.skip:
+        suites["tts"] = bench_tts(args.cards, args.repeat)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "peak_rss_mb": peak_rss_mb(),
+        "models": registry.stats()["models"],
+        "suites": suites,
+        "failures": failures,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Peak RSS {report['peak_rss_mb']} MB; results written to {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
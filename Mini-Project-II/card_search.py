@@ -0,0 +1,82 @@
+import os
+import threading
+
+import numpy as np
+
+import metrics
+from deck_store import DECK_DB, deck_store
+from flashcard import embed_sentences
+from vector_index import VectorIndex
+
+# Directory of the persistent card vector index; defaults to sit next to the deck store
+CARD_INDEX_DIR = os.environ.get("FLASHCARD_CARD_INDEX_DIR") or (
+    os.path.join(os.path.dirname(os.path.abspath(DECK_DB)), "card_index") if DECK_DB else None)
+# FLASHCARD_INDEX_NLIST=0 keeps the index flat (exact); unset picks a partition count automatically
+CARD_INDEX_NLIST = os.environ.get("FLASHCARD_INDEX_NLIST")
+
+card_index = VectorIndex(
+    CARD_INDEX_DIR,
+    nlist=int(CARD_INDEX_NLIST) if CARD_INDEX_NLIST else None,
+    nprobe=int(os.environ.get("FLASHCARD_INDEX_NPROBE", 16)),
+) if deck_store is not None else None
+# Serializes index updates, so a deck's cards are read and added before a replacing deck removes them
+_index_lock = threading.Lock()
+
+
+def _add_cards(cards, batch_size=1024):
+    for start in range(0, len(cards), batch_size):
+        batch = cards[start:start + batch_size]
+        # Card texts are the ranked sentences, so these are mostly embedding cache hits
+        vectors = embed_sentences([card["text"] for card in batch])
+        if vectors is None:
+            return
+        card_index.add([card["id"] for card in batch], vectors)
+
+
+def index_deck(deck_id, replaced=()):
+    """ Add a stored deck's cards to the vector index, dropping the cards of the deck it replaced """
+    if card_index is None:
+        return
+    with _index_lock:
+        card_index.remove(replaced)
+        # Read under the lock: a deck replaced meanwhile has no cards left to add
+        _add_cards(deck_store.cards(deck_id))
+        card_index.flush()
+
+
+def remove_deck(deck_id):
+    """ Delete a deck from the store and its cards from the vector index """
+    if card_index is None:
+        return
+    with _index_lock:
+        card_index.remove([card["id"] for card in deck_store.cards(deck_id)])
+        deck_store.delete(deck_id)
+        card_index.flush()
+
+
+def sync_card_index():
+    """ Index stored cards the vector index has not seen and drop ids no longer in the store """
+    if card_index is None:
+        return 0
+    with _index_lock:
+        cards = deck_store.cards()
+        stored_ids = {card["id"] for card in cards}
+        stale = [i for i in card_index.row_of if i not in stored_ids]
+        missing = [card for card in cards if card["id"] not in card_index.row_of]
+        card_index.remove(stale)
+        _add_cards(missing)
+        card_index.flush()
+    return len(missing)
+
+
+def search_cards(query, k=10):
+    """ The k cards closest in meaning to query across every stored deck, with their similarity """
+    if card_index is None or not query.strip():
+        return []
+    with metrics.span("card_search"):
+        vectors = embed_sentences([query.strip()])
+        if vectors is None:
+            return []
+        hits = card_index.search(np.asarray(vectors)[0], k)
+        cards = {card["id"]: card for card in deck_store.cards(ids=[i for i, _ in hits])}
+    return [dict(cards[i], score=score) for i, score in hits if i in cards]
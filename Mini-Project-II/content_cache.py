@@ -0,0 +1,94 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class ContentCache:
+    """ Results keyed by a content hash: a bounded in-memory LRU, optionally backed by files
+
+    With disk_dir, every entry is also written to its own file (under a
+    two-character fan-out directory) via a temporary file and os.replace, so
+    results survive restarts and worker processes sharing the directory never
+    read a partial entry. A disk that is full or read-only only costs the
+    disk tier: the error is printed and the value is still returned.
+    """
+    binary = False      # str values in text files, or bytes
+    extension = "txt"   # file extension when the caller does not give one
+    label = "cache"     # used in error messages
+
+    def __init__(self, max_entries=512, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key, extension=None):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.{extension or self.extension}")
+
+    def _open(self, path, mode):
+        if self.binary:
+            return open(path, mode + "b")
+        return open(path, mode, encoding="utf-8")
+
+    def get(self, key, extension=None):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.disk_dir:
+            try:
+                with self._open(self._disk_path(key, extension), "r") as f:
+                    value = f.read()
+            except OSError:
+                value = None
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._remember(key, value)
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, key, value, extension=None):
+        with self._lock:
+            self._remember(key, value)
+        if self.disk_dir:
+            path = self._disk_path(key, extension)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with self._open(tmp_path, "w") as f:
+                    f.write(value)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Error writing {self.label} entry: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+
+# SQLite file holding every generated deck (FLASHCARD_DECK_DB="" turns the store off)
+DECK_DB = os.environ.get("FLASHCARD_DECK_DB",
+                         os.path.join(os.path.expanduser("~"), ".cache", "flashcard", "decks.db"))
+
+# PRAGMA user_version of the current layout; older databases are migrated on open
+SCHEMA_VERSION = 2
+
+# Decks still being streamed in sit under a "pending:" key; ones left behind by a crash are dropped after this
+PENDING_MAX_AGE = 24 * 3600
+
+CARDS_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,  -- never reused, since ids key the card vector index
+    deck_id INTEGER NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS decks (
+    id INTEGER PRIMARY KEY,
+    text_hash TEXT NOT NULL UNIQUE,
+    source TEXT,
+    word_count INTEGER NOT NULL,
+    model TEXT,  -- generation_settings() fingerprint the deck was made with
+    created REAL NOT NULL,
+    flashcards TEXT NOT NULL
+);
+""" + CARDS_TABLE.format(name="cards") + """
+CREATE INDEX IF NOT EXISTS cards_deck ON cards(deck_id, position);
+CREATE TABLE IF NOT EXISTS sentences (
+    deck_id INTEGER NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    embedding BLOB,
+    PRIMARY KEY (deck_id, position)
+);
+"""
+
+# External-content FTS5 index over cards, kept in sync by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5(text, content='cards', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS cards_ai AFTER INSERT ON cards BEGIN
+    INSERT INTO cards_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS cards_ad AFTER DELETE ON cards BEGIN
+    INSERT INTO cards_fts(cards_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+def text_hash(text, settings=None):
+    """ Key of a deck: hash of the whitespace-normalized source text plus the generation settings
+
+    Changing the embedding backend, segmenter or selection settings changes
+    the cards a text produces, so decks made with other settings do not match.
+    """
+    payload = f"{settings or ''}\0{' '.join(text.split())}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class DeckStore:
+    """ Persistent SQLite (WAL) store of decks, their source sentences and embeddings
+
+    Decks are keyed by text_hash(text, settings), so regenerating an already processed text
+    is a single indexed lookup. Cards are full-text searchable through FTS5
+    when the SQLite build has it, with a LIKE scan as the fallback. Each
+    thread gets its own connection; WAL lets readers run alongside a writer.
+    Streamed decks are written with begin(), append_sentences() per section
+    and finish(), so their sentences never have to be held in memory at once.
+    """
+
+    def __init__(self, path=DECK_DB):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        migrated = self._migrate(conn)
+        try:
+            conn.executescript(FTS_SCHEMA)
+            if migrated:
+                conn.execute("INSERT INTO cards_fts(cards_fts) VALUES ('rebuild')")
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            print("SQLite has no FTS5 support; card search falls back to LIKE.")
+            self.has_fts = False
+        conn.execute("DELETE FROM decks WHERE text_hash LIKE 'pending:%' AND created < ?",
+                     (time.time() - PENDING_MAX_AGE,))
+        conn.commit()
+
+    def _migrate(self, conn):
+        """ Bring a database created by an older schema up to SCHEMA_VERSION; True if cards were rebuilt """
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return False
+        rebuilt = False
+        cards_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'cards'").fetchone()[0]
+        if "AUTOINCREMENT" not in cards_sql.upper():
+            # Version 1 let SQLite reuse deleted card ids; copy the rows into an AUTOINCREMENT table
+            print("Migrating deck store cards table to schema version 2...")
+            conn.executescript("PRAGMA foreign_keys=OFF;\nBEGIN IMMEDIATE;\n"
+                               "DROP TRIGGER IF EXISTS cards_ai;\nDROP TRIGGER IF EXISTS cards_ad;\n"
+                               + CARDS_TABLE.format(name="cards_v2") +
+                               "INSERT INTO cards_v2 (id, deck_id, position, name, text) "
+                               "SELECT id, deck_id, position, name, text FROM cards;\n"
+                               "DROP TABLE cards;\nALTER TABLE cards_v2 RENAME TO cards;\n"
+                               "CREATE INDEX IF NOT EXISTS cards_deck ON cards(deck_id, position);\n"
+                               "COMMIT;\nPRAGMA foreign_keys=ON;")
+            rebuilt = True
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return rebuilt
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def get(self, text, settings=None):
+        """ The deck stored for this text and settings as {"id", "flashcards", "source", "created"}, or None """
+        row = self._connect().execute(
+            "SELECT id, flashcards, source, created FROM decks WHERE text_hash = ?",
+            (text_hash(text, settings),)).fetchone()
+        if row is None:
+            return None
+        return {"id": row["id"], "flashcards": json.loads(row["flashcards"]),
+                "source": row["source"], "created": row["created"]}
+
+    def put(self, text, flashcards, sentences=None, embeddings=None, source=None, settings=None):
+        """ Store (or replace) the deck generated from text with these settings
+
+        Returns (deck id, ids of the cards of the replaced deck), so callers can
+        drop the replaced cards from anything keyed by card id.
+        """
+        key = text_hash(text, settings)
+        conn = self._connect()
+        with conn:
+            # Write lock up front, so the replaced cards read here are the ones deleted below
+            conn.execute("BEGIN IMMEDIATE")
+            replaced = self._drop(conn, key)
+            deck_id = conn.execute(
+                "INSERT INTO decks (text_hash, source, word_count, model, created, flashcards) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, source, len(text.split()), settings, time.time(),
+                 json.dumps(flashcards, ensure_ascii=False))).lastrowid
+            self._insert_cards(conn, deck_id, flashcards)
+            if sentences:
+                self._insert_sentences(conn, deck_id, sentences, embeddings, 0)
+        return deck_id, replaced
+
+    def begin(self, source=None):
+        """ Start a deck whose sentences are written section by section; returns its id
+
+        The deck is kept under a pending key, so get() does not see it until
+        finish() gives it its cards and real key.
+        """
+        conn = self._connect()
+        with conn:
+            return conn.execute(
+                "INSERT INTO decks (text_hash, source, word_count, created, flashcards) VALUES (?, ?, 0, ?, '{}')",
+                (f"pending:{uuid.uuid4().hex}", source, time.time())).lastrowid
+
+    def append_sentences(self, deck_id, sentences, embeddings=None):
+        """ Add the next section's sentences (and their embeddings) to a deck started with begin() """
+        conn = self._connect()
+        with conn:
+            start = conn.execute("SELECT COUNT(*) FROM sentences WHERE deck_id = ?", (deck_id,)).fetchone()[0]
+            self._insert_sentences(conn, deck_id, sentences, embeddings, start)
+
+    def finish(self, deck_id, text, flashcards, settings=None):
+        """ Publish a deck started with begin(), replacing any deck stored for the same text and settings
+
+        Returns (deck id, ids of the cards of the replaced deck), like put().
+        """
+        key = text_hash(text, settings)
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            replaced = self._drop(conn, key)
+            conn.execute("UPDATE decks SET text_hash = ?, word_count = ?, model = ?, created = ?, flashcards = ? "
+                         "WHERE id = ?", (key, len(text.split()), settings, time.time(),
+                                          json.dumps(flashcards, ensure_ascii=False), deck_id))
+            self._insert_cards(conn, deck_id, flashcards)
+        return deck_id, replaced
+
+    def _drop(self, conn, key):
+        """ Delete the deck stored under key; returns the ids of its cards """
+        replaced = [row[0] for row in conn.execute(
+            "SELECT cards.id FROM cards JOIN decks ON decks.id = cards.deck_id WHERE decks.text_hash = ?",
+            (key,))]
+        conn.execute("DELETE FROM decks WHERE text_hash = ?", (key,))
+        return replaced
+
+    def _insert_cards(self, conn, deck_id, flashcards):
+        conn.executemany("INSERT INTO cards (deck_id, position, name, text) VALUES (?, ?, ?, ?)",
+                         [(deck_id, i, name, card) for i, (name, card) in enumerate(flashcards.items())])
+
+    def _insert_sentences(self, conn, deck_id, sentences, embeddings, start):
+        vectors = np.asarray(embeddings, dtype=np.float32) if embeddings is not None else None
+        conn.executemany(
+            "INSERT INTO sentences (deck_id, position, text, embedding) VALUES (?, ?, ?, ?)",
+            [(deck_id, start + i, sentence, vectors[i].tobytes() if vectors is not None else None)
+             for i, sentence in enumerate(sentences)])
+
+    def sentences(self, deck_id):
+        """ (sentences, float32 embeddings or None) stored with a deck """
+        rows = self._connect().execute(
+            "SELECT text, embedding FROM sentences WHERE deck_id = ? ORDER BY position", (deck_id,)).fetchall()
+        texts = [row["text"] for row in rows]
+        if not rows or any(row["embedding"] is None for row in rows):
+            return texts, None
+        return texts, np.stack([np.frombuffer(row["embedding"], dtype=np.float32) for row in rows])
+
+    def cards(self, deck_id=None, ids=None):
+        """ Cards as dicts (id, deck_id, name, text, source) of one deck, of the given card ids, or all """
+        query = ("SELECT cards.id, cards.deck_id, cards.name, cards.text, decks.source "
+                 "FROM cards JOIN decks ON decks.id = cards.deck_id")
+        conn = self._connect()
+        if deck_id is not None:
+            rows = conn.execute(query + " WHERE cards.deck_id = ? ORDER BY cards.position", (deck_id,)).fetchall()
+        elif ids is not None:
+            ids = [int(i) for i in ids]
+            rows = []
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows += conn.execute(query + f" WHERE cards.id IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+        else:
+            rows = conn.execute(query + " ORDER BY cards.id").fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, query, limit=20):
+        """ Cards matching query across all decks, best matches first """
+        conn = self._connect()
+        if self.has_fts:
+            # Quote each term so user input is never parsed as FTS query syntax
+            terms = " ".join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+            if not terms:
+                return []
+            rows = conn.execute(
+                "SELECT cards.id, cards.deck_id, cards.name, cards.text, decks.source "
+                "FROM cards_fts JOIN cards ON cards.id = cards_fts.rowid JOIN decks ON decks.id = cards.deck_id "
+                "WHERE cards_fts MATCH ? ORDER BY bm25(cards_fts) LIMIT ?", (terms, limit)).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT cards.id, cards.deck_id, cards.name, cards.text, decks.source "
+                "FROM cards JOIN decks ON decks.id = cards.deck_id WHERE cards.text LIKE ? LIMIT ?",
+                (f"%{query}%", limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, deck_id):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM decks WHERE id = ?", (deck_id,))
+
+    def stats(self):
+        conn = self._connect()
+        return {
+            "decks": conn.execute("SELECT COUNT(*) FROM decks WHERE text_hash NOT LIKE 'pending:%'").fetchone()[0],
+            "cards": conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0],
+            "words": conn.execute("SELECT COALESCE(SUM(word_count), 0) FROM decks").fetchone()[0],
+        }
+
+
+deck_store = DeckStore(DECK_DB) if DECK_DB else None
@@ -0,0 +1,99 @@
+import os
+import re
+import zlib
+
+import numpy as np
+
+import metrics
+
+# Estimated Jaccard similarity of word shingles above which two sentences are
+# treated as the same point (FLASHCARD_DEDUPE_THRESHOLD=0 turns dedupe off)
+DEDUPE_THRESHOLD = float(os.environ.get("FLASHCARD_DEDUPE_THRESHOLD", 0.8))
+
+NUM_PERM = 64
+BANDS = 16           # 16 bands x 4 rows: pairs around 0.5 Jaccard and up become candidates
+SHINGLE_WORDS = 3
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, _MAX_HASH, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _MAX_HASH, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingles(sentence, size=SHINGLE_WORDS):
+    """ Set of overlapping word n-grams of the lower-cased sentence (punctuation dropped) """
+    words = re.findall(r"\w+", sentence.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash_signature(shingle_set):
+    """ NUM_PERM min-hashes of a shingle set (universal hashing of crc32 values) """
+    if not shingle_set:
+        return np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set),
+                         dtype=np.uint64, count=len(shingle_set))
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % _PRIME
+    return (permuted & _MAX_HASH).min(axis=0)
+
+
+def near_duplicate_groups(sentences, threshold=None, signature_cache=None):
+    """ Cluster near-identical sentences with MinHash + LSH banding
+
+    Returns a list mapping each sentence index to the index of its group's
+    representative (the earliest member). Only sentences sharing an LSH band
+    are compared, so the cost stays close to linear in the number of sentences.
+    signature_cache (sentence -> signature dict) lets repeated calls on mostly
+    the same sentences skip re-hashing them.
+    """
+    threshold = DEDUPE_THRESHOLD if threshold is None else threshold
+    parent = list(range(len(sentences)))
+    if threshold <= 0 or len(sentences) < 2:
+        return parent
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if signature_cache is None:
+        signatures = np.stack([minhash_signature(shingles(s)) for s in sentences])
+    else:
+        for s in sentences:
+            if s not in signature_cache:
+                signature_cache[s] = minhash_signature(shingles(s))
+        signatures = np.stack([signature_cache[s] for s in sentences])
+
+    rows = NUM_PERM // BANDS
+    for band in range(BANDS):
+        # One opaque key per row of the band; only rows sharing a key are candidates
+        keys = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows]).view(f"V{rows * 8}").ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        shared = counts[inverse] > 1
+        if not shared.any():
+            continue
+        candidates = np.flatnonzero(shared)
+        order = candidates[np.argsort(inverse[candidates], kind="stable")]
+        bounds = np.flatnonzero(np.diff(inverse[order])) + 1
+        for members in np.split(order, bounds):
+            first = members[0]
+            for other in members[1:]:
+                a, b = find(first), find(other)
+                if a == b:
+                    continue
+                if np.mean(signatures[first] == signatures[other]) >= threshold:
+                    # Keep the earlier sentence as the representative
+                    parent[max(a, b)] = min(a, b)
+    return [find(i) for i in range(len(sentences))]
+
+
+def dedupe_sentences(sentences, threshold=None, signature_cache=None):
+    """ Drop sentences that are near-duplicates of an earlier one, keeping order """
+    with metrics.span("dedupe"):
+        groups = near_duplicate_groups(sentences, threshold, signature_cache)
+        unique = [s for i, s in enumerate(sentences) if groups[i] == i]
+    metrics.count("near_duplicates", len(sentences) - len(unique))
+    return unique
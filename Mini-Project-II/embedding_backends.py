@@ -0,0 +1,154 @@
+import os
+
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Where exported / quantized ONNX models are kept between runs
+ONNX_CACHE_DIR = os.environ.get("FLASHCARD_ONNX_DIR",
+                                os.path.join(os.path.expanduser("~"), ".cache", "flashcard-onnx"))
+
+# Memory caps for one encoder call: padded tokens (batch size x longest
+# sentence in the batch) and sentences per batch
+MAX_BATCH_TOKENS = int(os.environ.get("FLASHCARD_EMBED_MAX_TOKENS", 8192))
+MAX_BATCH_SIZE = int(os.environ.get("FLASHCARD_EMBED_MAX_BATCH", 128))
+
+
+def mean_pool(token_embeddings, attention_mask):
+    """ Average token vectors over real (non-padding) tokens """
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (token_embeddings * mask).sum(axis=1)
+    return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+def l2_normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+def length_buckets(lengths, max_tokens=None, max_batch_size=None):
+    """ Split indices into batches of similar token length under a padded-token budget
+
+    Indices are sorted by length, and a batch is closed as soon as adding the
+    next (longer) sentence would make batch size x longest length exceed
+    max_tokens. A sentence longer than the whole budget gets a batch of its own.
+    """
+    max_tokens = max_tokens or MAX_BATCH_TOKENS
+    max_batch_size = max_batch_size or MAX_BATCH_SIZE
+    order = np.argsort(np.asarray(lengths), kind="stable")
+    batch, longest = [], 0
+    for index in order:
+        length = max(1, int(lengths[index]))
+        if batch and (len(batch) >= max_batch_size or (len(batch) + 1) * max(longest, length) > max_tokens):
+            yield np.asarray(batch)
+            batch, longest = [], 0
+        batch.append(index)
+        longest = max(longest, length)
+    if batch:
+        yield np.asarray(batch)
+
+
+def encode_bucketed(lengths, encode_batch, max_tokens=None, max_batch_size=None):
+    """ Run encode_batch(indices) per length bucket; returns float32 rows in the original order """
+    output = None
+    for index in length_buckets(lengths, max_tokens, max_batch_size):
+        vectors = np.asarray(encode_batch(index), dtype=np.float32)
+        if output is None:
+            output = np.empty((len(lengths), vectors.shape[1]), dtype=np.float32)
+        output[index] = vectors
+    return output
+
+
+def token_lengths(tokenizer, sentences, max_length):
+    """ Token count of each sentence (with special tokens, after truncation) """
+    encoded = tokenizer(list(sentences), truncation=True, max_length=max_length)
+    return encoded, [len(ids) for ids in encoded["input_ids"]]
+
+
+def pad_features(tokenizer, encoded, index, return_tensors="np"):
+    """ Pad the selected rows of a tokenizer output to the longest row among them """
+    return tokenizer.pad({name: [encoded[name][i] for i in index] for name in encoded},
+                         padding=True, return_tensors=return_tensors)
+
+
+def export_onnx(model_name, path):
+    """ Export the transformer body of model_name to ONNX with dynamic batch/sequence axes """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in input_names), path,
+                          input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic_axes, opset_version=14)
+
+
+def quantize_onnx(fp32_path, int8_path):
+    """ Dynamic (weight-only int8, activations quantized on the fly) quantization """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+
+class OnnxEncoder:
+    """ Sentence encoder running MiniLM through ONNX Runtime on CPU
+
+    Mirrors SentenceTransformer's pipeline for all-MiniLM-L6-v2 (mean pooling
+    followed by L2 normalization). With quantize=True the exported graph is
+    dynamically quantized to int8. Sentences are grouped into length buckets
+    (see length_buckets), so short sentences are not padded to the longest one.
+    """
+
+    def __init__(self, model_name, quantize=False, max_length=256, cache_dir=ONNX_CACHE_DIR):
+        if ort is None:
+            raise ImportError("onnxruntime is not installed")
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        stem = os.path.join(cache_dir, model_name.replace("/", "__"))
+        fp32_path = stem + ".onnx"
+        if not os.path.exists(fp32_path):
+            export_onnx(model_name, fp32_path)
+        path = fp32_path
+        if quantize:
+            path = stem + ".int8.onnx"
+            if not os.path.exists(path):
+                quantize_onnx(fp32_path, path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = int(os.environ.get("FLASHCARD_ONNX_THREADS", 0))
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _run(self, features):
+        feed = {name: np.asarray(features[name], dtype=np.int64) for name in self.input_names}
+        token_embeddings = self.session.run(None, feed)[0]
+        return mean_pool(token_embeddings, feed["attention_mask"])
+
+    def encode(self, sentences, max_tokens=None, max_batch_size=None):
+        if not sentences:
+            return np.zeros((0, 0), dtype=np.float32)
+        encoded, lengths = token_lengths(self.tokenizer, sentences, self.max_length)
+        output = encode_bucketed(lengths, lambda index: self._run(pad_features(self.tokenizer, encoded, index)),
+                                 max_tokens, max_batch_size)
+        return l2_normalize(output)
+
+
+def quantize_sentence_transformer(model):
+    """ Dynamic int8 quantization of every Linear layer of a SentenceTransformer (PyTorch) """
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
@@ -0,0 +1,326 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+
+# Element types vectors may be kept in; int8 stores one float32 scale per vector
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+
+def pack_vector(vector, dtype):
+    """ Compress a float32 vector for storage (symmetric per-vector scaling for int8) """
+    if dtype == "float16":
+        return vector.astype(np.float16)
+    if dtype == "int8":
+        scale = float(np.abs(vector).max()) / 127.0 or 1.0
+        return np.round(vector / scale).astype(np.int8), np.float32(scale)
+    return vector.astype(np.float32)
+
+
+def unpack_vector(stored):
+    if isinstance(stored, tuple):
+        values, scale = stored
+        return values.astype(np.float32) * scale
+    return stored.astype(np.float32)
+
+
+def normalize_sentence(sentence):
+    """ Collapse whitespace so trivially reformatted sentences share a key """
+    return " ".join(sentence.split())
+
+
+def sentence_key(sentence, model_name):
+    """ Content hash of the normalized sentence plus the model that encodes it """
+    payload = f"{model_name}\0{normalize_sentence(sentence)}".encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+class _FileLock:
+    """ Inter-process lock on a file: shared for readers, exclusive for writers
+
+    flock locks belong to the open file, not the thread, so callers must
+    also hold a thread lock (EmbeddingCache does). On Windows every hold is
+    exclusive.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "a+b")
+
+    @contextmanager
+    def hold(self, exclusive=False):
+        fd = self._file.fileno()
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ten seconds; keep waiting
+            try:
+                yield
+            finally:
+                self._file.seek(0)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class _DiskTier:
+    """ Fixed-capacity float32/float16 memmap of vectors, shareable between processes
+
+    Rows are handed out under an exclusive file lock, and every assignment is
+    appended to index.log as "<key> <row>". Before reading or writing, each
+    process replays the log lines other processes added since its last look,
+    so all of them agree on which key owns which row. Reads hold a shared
+    lock, so a row cannot be reused while it is being read. When full, the
+    oldest row is reused. The log is rewritten once it grows to several
+    times the capacity. Vectors reach other processes through the shared
+    mapping immediately; msync to disk is throttled to FLUSH_SECONDS.
+    """
+
+    FLUSH_SECONDS = 10.0
+
+    def __init__(self, directory, capacity, dtype="float32"):
+        self.directory = directory
+        self.capacity = capacity
+        self.dtype = np.float16 if dtype == "float16" else np.float32
+        self.dim = None
+        self.vectors = None
+        self.rows = OrderedDict()  # key -> row, oldest first
+        self.owner = {}            # row -> key
+        self.next_row = 0
+        self._log_offset = 0
+        self._log_inode = None
+        self._log_lines = 0
+        self._last_flush = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        suffix = "f16" if self.dtype == np.float16 else "f32"
+        self._meta_path = os.path.join(directory, f"meta.{suffix}.json")
+        self._log_path = os.path.join(directory, f"index.{suffix}.log")
+        self._vectors_path = os.path.join(directory, f"vectors.{suffix}")
+        self._file_lock = _FileLock(os.path.join(directory, f"cache.{suffix}.lock"))
+        with self._file_lock.hold():
+            self._sync()
+
+    def _open_vectors(self):
+        if self.vectors is not None or not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r") as f:
+            meta = json.load(f)
+        if meta["capacity"] != self.capacity:
+            print(f"Embedding cache on disk has capacity {meta['capacity']}; using it instead of {self.capacity}.")
+            self.capacity = meta["capacity"]
+        self.dim = meta["dim"]
+        self.vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode="r+", shape=(self.capacity, self.dim))
+
+    def _apply(self, key, row):
+        previous = self.owner.get(row)
+        if previous is not None:
+            self.rows.pop(previous, None)
+        self.rows.pop(key, None)
+        self.rows[key] = row
+        self.owner[row] = key
+        self.next_row = max(self.next_row, row + 1)
+
+    def _sync(self):
+        """ Replay index lines appended by other processes (caller holds the file lock) """
+        self._open_vectors()
+        try:
+            stat = os.stat(self._log_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._log_inode or stat.st_size < self._log_offset:
+            # First look, or another process compacted the log: replay it from the start
+            self.rows, self.owner, self.next_row = OrderedDict(), {}, 0
+            self._log_offset, self._log_lines, self._log_inode = 0, 0, stat.st_ino
+        if stat.st_size == self._log_offset:
+            return
+        with open(self._log_path, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # a torn last line from a crash is left for later
+        for line in data[:end].splitlines():
+            try:
+                key, row = line.split()
+                self._apply(key.decode("ascii"), int(row))
+                self._log_lines += 1
+            except ValueError:
+                continue
+        self._log_offset += end
+
+    def get_many(self, keys):
+        """ {key: float32 vector} for the keys present on disk """
+        with self._file_lock.hold():
+            self._sync()
+            found = {}
+            for key in keys:
+                row = self.rows.get(key)
+                if row is not None:
+                    found[key] = np.array(self.vectors[row], dtype=np.float32)
+            return found
+
+    def put_many(self, items):
+        """ Store (key, vector) pairs; keys another process already stored are skipped """
+        if not items:
+            return
+        with self._file_lock.hold(exclusive=True):
+            self._sync()
+            if self.vectors is None:
+                self.dim = items[0][1].shape[0]
+                self.vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode="w+",
+                                         shape=(self.capacity, self.dim))
+                with open(self._meta_path, "w") as f:
+                    json.dump({"capacity": self.capacity, "dim": self.dim}, f)
+            lines = []
+            for key, vector in items:
+                if key in self.rows or vector.shape[0] != self.dim:
+                    continue
+                if self.next_row < self.capacity:
+                    row = self.next_row
+                else:
+                    # Reuse the slot of the oldest entry
+                    row = next(iter(self.rows.values()))
+                self.vectors[row] = vector
+                self._apply(key, row)
+                lines.append(f"{key} {row}\n")
+            if lines:
+                with open(self._log_path, "ab") as f:
+                    f.write("".join(lines).encode("ascii"))
+                self._log_offset += len("".join(lines))
+                self._log_lines += len(lines)
+                if self._log_inode is None:
+                    self._log_inode = os.stat(self._log_path).st_ino
+            if self._log_lines > 4 * self.capacity:
+                self._compact()
+        if time.monotonic() - self._last_flush > self.FLUSH_SECONDS:
+            self.flush()
+
+    def _compact(self):
+        """ Rewrite the log with one line per live key (caller holds the exclusive lock) """
+        tmp_path = self._log_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write("".join(f"{key} {row}\n" for key, row in self.rows.items()).encode("ascii"))
+        os.replace(tmp_path, self._log_path)
+        stat = os.stat(self._log_path)
+        self._log_inode, self._log_offset, self._log_lines = stat.st_ino, stat.st_size, len(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def flush(self):
+        """ msync written vectors to disk """
+        self._last_flush = time.monotonic()
+        if self.vectors is not None:
+            self.vectors.flush()
+
+
+class EmbeddingCache:
+    """ Two-tier (in-memory LRU + optional memmapped disk) sentence vector cache
+
+    dtype selects how vectors are held: float16 halves and int8 quarters the
+    memory of float32 (the disk tier keeps int8 caches as float16). Vectors
+    are always handed back as float32.
+    """
+
+    def __init__(self, max_entries=50000, disk_dir=None, disk_capacity=500000, dtype="float32"):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown embedding storage dtype '{dtype}', expected one of {STORAGE_DTYPES}")
+        self.max_entries = max_entries
+        self.dtype = dtype
+        self._memory = OrderedDict()
+        self._disk = _DiskTier(disk_dir, disk_capacity, "float32" if dtype == "float32" else "float16") \
+            if disk_dir else None
+        if self._disk is not None:
+            atexit.register(self._disk.flush)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        stored = self._memory.get(key)
+        if stored is not None:
+            self._memory.move_to_end(key)
+            return unpack_vector(stored)
+        return None
+
+    def _remember(self, key, vector):
+        """ Store vector in the LRU and return its packed form (the entry itself may be evicted at once) """
+        stored = self._memory[key] = pack_vector(vector, self.dtype)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+        return stored
+
+    def encode(self, sentences, model_name, encode_fn):
+        """ Return float32 embeddings for sentences, calling encode_fn only on cache misses """
+        if not sentences:
+            return np.empty((0, 0), dtype=np.float32)
+        keys = [sentence_key(s, model_name) for s in sentences]
+        found = {}
+        missing = OrderedDict()  # key -> sentence, deduplicated within the batch
+
+        with self._lock:
+            for key, sentence in zip(keys, sentences):
+                if key in found or key in missing:
+                    continue
+                vector = self._lookup(key)
+                if vector is None:
+                    missing[key] = sentence
+                else:
+                    found[key] = vector
+            if missing and self._disk is not None:
+                # One shared-lock pass over the disk tier for the whole batch
+                on_disk = self._disk.get_many(list(missing))
+                for key, vector in on_disk.items():
+                    del missing[key]
+                    self._remember(key, vector)
+                    found[key] = vector
+                self.disk_hits += len(on_disk)
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            new_vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            with self._lock:
+                for key, vector in zip(missing, new_vectors):
+                    stored = self._remember(key, vector)
+                    # Hand back the stored precision so hits and misses rank identically
+                    found[key] = unpack_vector(stored) if self.dtype != "float32" else vector
+                if self._disk is not None:
+                    self._disk.put_many(list(zip(missing, new_vectors)))
+
+        return np.stack([found[key] for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk) if self._disk is not None else 0,
+            }
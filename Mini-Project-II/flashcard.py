@@ -1,12 +1,71 @@
+import os
 import spacy
 import numpy as np
-import networkx as nx
-from sklearn.metrics.pairwise import cosine_similarity
 from sentence_transformers import SentenceTransformer
 from transformers import AutoModel, AutoTokenizer
+from model_registry import registry
+from embedding_cache import EmbeddingCache
+from embedding_backends import (OnnxEncoder, encode_bucketed, pad_features, quantize_sentence_transformer,
+                                token_lengths)
+from ranking import iter_mmr, rank_sentences
+from dedupe import DEDUPE_THRESHOLD, dedupe_sentences
+import metrics
 
-def load_embedder():
-    model_name = 'sentence-transformers/all-MiniLM-L6-v2'
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+SPACY_MODEL = "en_core_web_sm"
+
+# Sentence segmentation mode (FLASHCARD_SEGMENTER):
+#   "full"        - the complete en_core_web_sm pipeline
+#   "parser"      - only tok2vec + parser; same sentence boundaries as "full", less work
+#   "senter"      - the small statistical sentence recognizer shipped with the model
+#   "sentencizer" - rule-based punctuation splitter, no model weights at all
+SEGMENTER_MODES = ("full", "parser", "senter", "sentencizer")
+SEGMENTER = os.environ.get("FLASHCARD_SEGMENTER", "parser")
+
+# Card selection: weight of diversity against rank in MMR (0 = pure rank order)
+# and the most cards one document can produce
+MMR_DIVERSITY = float(os.environ.get("FLASHCARD_MMR_DIVERSITY", 0.3))
+MAX_FLASHCARDS = int(os.environ.get("FLASHCARD_MAX_CARDS", 40))
+
+# Embedding inference backend (FLASHCARD_EMBEDDING_BACKEND):
+#   "torch"     - SentenceTransformer in fp32 (TensorFlow weights as a fallback)
+#   "torch-int8" - the same model with Linear layers dynamically quantized to int8
+#   "onnx"      - exported to ONNX and run with ONNX Runtime
+#   "onnx-int8" - the ONNX export, dynamically quantized to int8
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+EMBEDDING_BACKEND = os.environ.get("FLASHCARD_EMBEDDING_BACKEND", "torch")
+
+# Set FLASHCARD_EMBEDDING_CACHE_DIR to also keep sentence vectors on disk, and
+# FLASHCARD_EMBEDDING_DTYPE to float16/int8 to shrink the cached vectors
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.environ.get("FLASHCARD_EMBEDDING_CACHE_SIZE", 50000)),
+    disk_dir=os.environ.get("FLASHCARD_EMBEDDING_CACHE_DIR") or None,
+    dtype=os.environ.get("FLASHCARD_EMBEDDING_DTYPE", "float32"),
+)
+
+def embedding_cache_key(backend=None):
+    # Quantized backends produce slightly different vectors, so they get their own entries
+    return f"{MODEL_NAME}:{backend or EMBEDDING_BACKEND}"
+
+def generation_settings():
+    """ Fingerprint of every setting that changes which cards a text produces """
+    return (f"{embedding_cache_key()}|segmenter={SEGMENTER}|mmr={MMR_DIVERSITY}|"
+            f"max_cards={MAX_FLASHCARDS}|dedupe={DEDUPE_THRESHOLD}")
+
+def load_embedder(backend=None):
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+    if backend in ("onnx", "onnx-int8"):
+        try:
+            return OnnxEncoder(MODEL_NAME, quantize=backend == "onnx-int8")
+        except Exception as e:
+            print(f"Error loading ONNX backend: {e}")
+            print("Falling back to the PyTorch model...")
+    elif backend == "torch-int8":
+        return quantize_sentence_transformer(SentenceTransformer(MODEL_NAME))
+
+    model_name = MODEL_NAME
     try:
         # Try loading directly with SentenceTransformer (PyTorch)
         return SentenceTransformer(model_name)
@@ -21,14 +80,58 @@ def load_embedder():
         except Exception as tf_e:
             raise Exception(f"Failed to load TensorFlow model: {tf_e}")
 
+def load_spacy(mode=None):
+    mode = mode or SEGMENTER
+    if mode == "full":
+        return spacy.load(SPACY_MODEL)
+    if mode == "parser":
+        return spacy.load(SPACY_MODEL, exclude=["tagger", "attribute_ruler", "lemmatizer", "ner"])
+    if mode == "senter":
+        nlp = spacy.load(SPACY_MODEL, exclude=["tok2vec", "tagger", "parser", "attribute_ruler",
+                                               "lemmatizer", "ner"])
+        nlp.enable_pipe("senter")
+        return nlp
+    if mode == "sentencizer":
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        return nlp
+    raise ValueError(f"Unknown segmenter mode '{mode}', expected one of {SEGMENTER_MODES}")
+
+registry.register("embedder", load_embedder)
+registry.register("spacy", load_spacy)
+
+def get_embedder():
+    return registry.get("embedder")
+
+def get_nlp():
+    return registry.get("spacy")
+
+# Models every generation needs; OCR and TTS engines stay lazy so missing ones cost nothing
+CORE_MODELS = ("embedder", "spacy")
+
+def warm_up_models(names=CORE_MODELS):
+    registry.warm_up(names)
+
 def preprocess_text(text):
-    nlp = spacy.load("en_core_web_sm")
-    doc = nlp(text)
-    sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+    nlp = get_nlp()
+    with metrics.span("sentence_split"):
+        doc = nlp(text)
+        sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+    metrics.count("sentences", len(sentences))
     return sentences
 
+def preprocess_texts(texts, n_process=1, batch_size=32):
+    """ Segment many documents at once through nlp.pipe; returns one sentence list per text """
+    nlp = get_nlp()
+    with metrics.span("sentence_split"):
+        return [[sent.text.strip() for sent in doc.sents if sent.text.strip()]
+                for doc in nlp.pipe(texts, n_process=n_process, batch_size=batch_size)]
+
 def determine_flashcard_count(text):
-    word_count = len(text.split())
+    return flashcard_budget(len(text.split()))
+
+def flashcard_budget(word_count):
+    """ Number of cards for a document of word_count words """
     if word_count < 100:
         return 3
     elif 100 <= word_count < 300:
@@ -36,51 +139,79 @@ def determine_flashcard_count(text):
     elif 300 <= word_count < 600:
         return 7
     else:
-        return 10
+        # One more card per 500 words past 1000, up to MAX_FLASHCARDS
+        return max(10, min(MAX_FLASHCARDS, 10 + (word_count - 1000) // 500))
 
-def generate_flashcards(text):
-    num_flashcards = determine_flashcard_count(text)
-    sentences = preprocess_text(text)
+def encode_sentences(model_or_tuple, sentences):
+    """ Encode sentences in length buckets under a padded-token budget, keeping input order
 
+    FLASHCARD_EMBED_MAX_TOKENS / FLASHCARD_EMBED_MAX_BATCH cap the size of each
+    padded batch, so one long sentence never pads the whole document.
+    """
     if not sentences:
-        return {}
-
-    model_or_tuple = load_embedder()
-
-    if isinstance(model_or_tuple, SentenceTransformer):
+        return np.zeros((0, 0), dtype=np.float32)
+    if isinstance(model_or_tuple, OnnxEncoder):
+        return model_or_tuple.encode(sentences)
+    elif isinstance(model_or_tuple, SentenceTransformer):
         model = model_or_tuple
-        embeddings = model.encode(sentences)
-        similarity_matrix = cosine_similarity(embeddings)
+        _, lengths = token_lengths(model.tokenizer, sentences, model.max_seq_length)
+        return encode_bucketed(lengths, lambda index: model.encode([sentences[i] for i in index],
+                                                                   batch_size=len(index)))
     elif isinstance(model_or_tuple, tuple) and len(model_or_tuple) == 2:
         tf_model, tokenizer = model_or_tuple
-        # Tokenize sentences for TensorFlow model
-        inputs = tokenizer(sentences, padding=True, truncation=True, return_tensors="tf")
-        # Get embeddings from TensorFlow model
-        outputs = tf_model(**inputs)
-        # Mean Pooling Strategy
-        def mean_pooling(model_output, attention_mask):
+        # Tokenize once without padding; each bucket is padded to its own longest sentence
+        encoded, lengths = token_lengths(tokenizer, sentences, tokenizer.model_max_length)
+
+        def encode_batch(index):
+            inputs = pad_features(tokenizer, encoded, index, return_tensors="tf")
+            # Get embeddings from TensorFlow model
+            outputs = tf_model(**inputs)
+            # Mean Pooling Strategy
             token_embeddings = outputs.last_hidden_state
             input_mask_expanded = np.expand_dims(inputs['attention_mask'].numpy(), axis=-1)
             sum_embeddings = np.sum(token_embeddings * input_mask_expanded, axis=1)
             sum_mask = np.clip(np.sum(input_mask_expanded, axis=1), a_min=1e-9, a_max=None)
             return sum_embeddings / sum_mask
-        embeddings = mean_pooling(outputs, inputs['attention_mask'])
-        similarity_matrix = cosine_similarity(embeddings)
-    else:
-        return {}
+        return encode_bucketed(lengths, encode_batch)
+    return None
+
+def is_supported_embedder(model_or_tuple):
+    return isinstance(model_or_tuple, (SentenceTransformer, OnnxEncoder)) or (
+        isinstance(model_or_tuple, tuple) and len(model_or_tuple) == 2)
+
+def embed_sentences(sentences):
+    """ Embed sentences through the shared cache; only unseen sentences hit the encoder """
+    model_or_tuple = get_embedder()
+    if not is_supported_embedder(model_or_tuple):
+        return None
 
-    graph = nx.from_numpy_array(similarity_matrix)
-    scores = nx.pagerank(graph)
+    def encode_misses(batch):
+        metrics.count("sentences_encoded", len(batch))
+        return encode_sentences(model_or_tuple, batch)
 
-    ranked_sentences = sorted(((scores[i], s) for i, s in enumerate(sentences)), reverse=True)
+    with metrics.span("embedding"):
+        return embedding_cache.encode(sentences, embedding_cache_key(), encode_misses)
+
+@metrics.timed("selection")
+def select_flashcards(sentences, scores, num_flashcards, embeddings=None, diversity=None):
+    """ Pick up to num_flashcards sentences, trimmed to at most three sub-sentences
+
+    With embeddings, candidates come in MMR order so near-synonymous top
+    sentences do not fill several cards; without them, in plain score order.
+    """
+    diversity = MMR_DIVERSITY if diversity is None else diversity
+    if embeddings is not None and diversity > 0:
+        candidates = iter_mmr(embeddings, scores, diversity)
+    else:
+        candidates = sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)
 
     selected = []
     used_phrases = set()
 
-    for _, sentence in ranked_sentences:
+    for index in candidates:
         if len(selected) >= num_flashcards:
             break
-        cleaned = sentence.strip()
+        cleaned = sentences[index].strip()
         if cleaned and cleaned not in used_phrases:
             trimmed = '. '.join(cleaned.split('. ')[:3]).strip()
             if not trimmed.endswith('.'):
@@ -88,9 +219,115 @@ def generate_flashcards(text):
             selected.append(trimmed)
             used_phrases.add(trimmed)
 
-    summarized_flashcards = selected
+    return selected
+
+def generate_flashcards(text, sentences=None, state=None):
+    """ Cards for text as {"Point i": card}; a state dict also receives the sentences and embeddings used """
+    num_flashcards = determine_flashcard_count(text)
+    if sentences is None:
+        sentences = preprocess_text(text)
+
+    # Collapse near-identical sentences (repeated OCR lines, transcript echoes) before embedding
+    sentences = dedupe_sentences(sentences)
+    if not sentences:
+        return {}
+
+    embeddings = embed_sentences(sentences)
+    if embeddings is None:
+        return {}
+    if state is not None:
+        state.update(sentences=sentences, embeddings=embeddings)
+
+    # Sparse top-k similarity graph + power-iteration PageRank (exact for small inputs)
+    scores = rank_sentences(embeddings)
+
+    summarized_flashcards = select_flashcards(sentences, scores, num_flashcards, embeddings=embeddings)
     flashcards = {f"Point {i+1}": point for i, point in enumerate(summarized_flashcards)}
     return flashcards
 
+def split_into_sections(text, max_words=1500):
+    """ Group paragraphs into sections of roughly max_words for streaming generation """
+    section, section_words = [], 0
+    for paragraph in text.split("\n\n"):
+        words = len(paragraph.split())
+        if not words:
+            continue
+        if section and section_words + words > max_words:
+            yield "\n\n".join(section)
+            section, section_words = [], 0
+        section.append(paragraph)
+        section_words += words
+    if section:
+        yield "\n\n".join(section)
+
+def iter_section_sentences(chunks, max_sentences=2000, pipe_batch_size=8):
+    """ Segment an iterator of text chunks lazily with nlp.pipe
+
+    Yields (section_text, sentences) per chunk; chunks with more than
+    max_sentences sentences are split so no section grows without bound.
+    """
+    nlp = get_nlp()
+    for doc in nlp.pipe(chunks, batch_size=pipe_batch_size):
+        sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+        metrics.count("sentences", len(sentences))
+        for start in range(0, len(sentences), max_sentences):
+            part = sentences[start:start + max_sentences]
+            yield " ".join(part), part
+
+def generate_flashcards_stream(chunks, max_sentences=2000, embed_batch_size=256, sink=None, total_words=None,
+                               segment=iter_section_sentences, signature_cache=None):
+    """ Generate cards section by section from an iterator of text chunks
+
+    Yields one dict of cards per section as soon as it is ranked, numbering
+    points continuously across sections. Only one section's sentences and
+    embeddings are held at a time, so peak memory does not grow with the
+    document. A sink(sentences, embeddings) callback receives each section's
+    vectors before they are dropped, e.g. to write them to the deck store.
+
+    With total_words (the document's length) the deck gets the same number
+    of cards as generate_flashcards would give the whole text, shared out
+    across sections by word count. Without it each section gets its own
+    count, up to MAX_FLASHCARDS for the whole stream.
+
+    segment(chunks, max_sentences) yields the (section_text, sentences)
+    pairs, and signature_cache is handed to dedupe; IncrementalDeck.stream
+    uses both to keep its per-paragraph state while streaming.
+    """
+    budget = flashcard_budget(total_words) if total_words else MAX_FLASHCARDS
+    point = words = 0
+    for section_text, sentences in segment(chunks, max_sentences=max_sentences):
+        words += len(section_text.split())
+        if total_words:
+            # Cumulative share, so rounding and short sections do not lose cards
+            count = round(budget * min(1.0, words / total_words)) - point
+        else:
+            count = min(determine_flashcard_count(section_text), budget - point)
+        if count <= 0 and sink is None:
+            continue
+        sentences = dedupe_sentences(sentences, signature_cache=signature_cache)
+        if not sentences:
+            continue
+        batches = []
+        for start in range(0, len(sentences), embed_batch_size):
+            batch = embed_sentences(sentences[start:start + embed_batch_size])
+            if batch is None:
+                return
+            batches.append(batch)
+        embeddings = np.concatenate(batches)
+        del batches
+        if sink is not None:
+            sink(sentences, embeddings)
+        if count <= 0:
+            continue
+
+        scores = rank_sentences(embeddings)
+        selected = select_flashcards(sentences, scores, count, embeddings=embeddings)
+        section_cards = {}
+        for card in selected:
+            point += 1
+            section_cards[f"Point {point}"] = card
+        if section_cards:
+            yield section_cards
+
 def get_flashcard_word_count(flashcards):
     return sum(len(card.split()) for card in flashcards.values())
\ No newline at end of file
@@ -1,22 +1,286 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
 import cv2
 import pytesseract
 import numpy as np
 from PIL import Image
 
+from content_cache import ContentCache
+from model_registry import registry
+import metrics
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+TESSERACT_CONFIG = "--psm 6 --oem 3"
+TESSERACT_LANG = "eng"
+
+# OCR backend (FLASHCARD_OCR_BACKEND): "auto" uses tesserocr when installed,
+# "tesserocr" requires it, "pytesseract" always shells out to the tesseract CLI
+OCR_BACKEND = os.environ.get("FLASHCARD_OCR_BACKEND", "auto")
+
+# Parameters of preprocess_image; part of the OCR cache key
+PREPROCESS_PARAMS = {
+    "blur_kernel": 5,
+    "threshold_block_size": 11,
+    "threshold_c": 2,
+    # Rescale so the median glyph is about this tall (px). ~30 px is 10-12 pt
+    # text at 300 DPI, where Tesseract is most accurate; larger pages are
+    # shrunk, smaller ones left alone. None disables rescaling.
+    "target_text_height": 30,
+    # Only send detected text blocks to Tesseract instead of the whole page
+    "detect_regions": True,
+}
+
+class PytesseractBackend:
+    """ Runs the tesseract CLI once per image (spawns a process, reloads language data) """
+    name = "pytesseract"
+    # Every call pays for a process spawn, so pages are read whole rather than region by region
+    ocr_regions = False
+
+    def __init__(self, config=TESSERACT_CONFIG, lang=TESSERACT_LANG):
+        self.config = config
+        self.lang = lang
+
+    def image_to_string(self, img):
+        return pytesseract.image_to_string(img, lang=self.lang, config=self.config)
+
+    def close(self):
+        pass
+
+class TesserocrPool:
+    """ Pool of long-lived Tesseract engines driven through the C API (tesserocr)
+
+    Engines are created on demand up to size and reused across requests, so
+    language data is loaded once per engine instead of once per image. Images
+    are handed over as raw pixel buffers, with no encode/decode step.
+    """
+    name = "tesserocr"
+    ocr_regions = True
+
+    def __init__(self, size=None, lang=TESSERACT_LANG, psm=6, oem=3):
+        if tesserocr is None:
+            raise ImportError("tesserocr is not installed")
+        self.size = size or int(os.environ.get("FLASHCARD_OCR_ENGINES", 0)) or os.cpu_count() or 1
+        self.lang = lang
+        self.psm = psm
+        self.oem = oem
+        self._idle = queue.LifoQueue()
+        self._engines = []
+        self._lock = threading.Lock()
+
+    def _new_engine(self):
+        return tesserocr.PyTessBaseAPI(lang=self.lang, psm=self.psm, oem=self.oem)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._engines) < self.size:
+                engine = self._new_engine()
+                self._engines.append(engine)
+                return engine
+        return self._idle.get()
+
+    def image_to_string(self, img):
+        img = np.ascontiguousarray(img)
+        if img.ndim == 3:
+            img = np.ascontiguousarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        height, width = img.shape[:2]
+        bytes_per_pixel = 1 if img.ndim == 2 else img.shape[2]
+        engine = self._acquire()
+        try:
+            engine.SetImageBytes(img.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+            return engine.GetUTF8Text()
+        finally:
+            engine.Clear()
+            self._idle.put(engine)
+
+    def close(self):
+        with self._lock:
+            for engine in self._engines:
+                engine.End()
+            self._engines = []
+            self._idle = queue.LifoQueue()
+
+def load_ocr_backend(name=None):
+    name = name or OCR_BACKEND
+    if name in ("auto", "tesserocr"):
+        try:
+            return TesserocrPool()
+        except ImportError:
+            if name == "tesserocr":
+                raise
+            print("tesserocr not available; falling back to pytesseract.")
+    elif name != "pytesseract":
+        raise ValueError(f"Unknown OCR backend '{name}'")
+    return PytesseractBackend()
+
+registry.register("ocr", load_ocr_backend)
+
+@metrics.timed("tesseract")
+def run_ocr(img):
+    """ OCR a preprocessed image with the shared, persistent backend """
+    return registry.get("ocr").image_to_string(img)
+
+def _as_buffer(source):
+    """ Expose an upload / file object as a buffer without copying when possible """
+    if hasattr(source, "getbuffer"):  # BytesIO, Streamlit UploadedFile
+        return source.getbuffer()
+    if hasattr(source, "read"):
+        return source.read()
+    return source
+
+def load_image(source):
+    """ Read an image from a path, encoded image bytes/buffer, file object or decoded array """
+    if isinstance(source, np.ndarray):
+        return source
+    source = _as_buffer(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        # np.frombuffer wraps the upload's memory directly; nothing touches the disk
+        return cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(source)
+
+def estimate_text_height(gray, max_side=1600):
+    """ Median glyph height in pixels, from connected components on a cheap downsample """
+    # Integer striding is free compared to a proper resize and is plenty for a median
+    step = max(1, int(np.ceil(max(gray.shape[:2]) / max_side)))
+    small = gray[::step, ::step]
+    scale = 1.0 / step
+    _, binary = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    # Keep glyph-sized blobs: drop specks, rules, borders and photos
+    glyphs = ((heights >= 3) & (stats[1:, cv2.CC_STAT_AREA] >= 4)
+              & (heights < small.shape[0] * 0.1) & (widths < small.shape[1] * 0.1))
+    if np.count_nonzero(glyphs) < 10:
+        return None
+    return float(np.median(heights[glyphs])) / scale
+
+def normalize_resolution(gray, target_text_height=None):
+    """ Downscale so text is about target_text_height pixels tall; never upscales """
+    target_text_height = target_text_height or PREPROCESS_PARAMS["target_text_height"]
+    if not target_text_height:
+        return gray
+    text_height = estimate_text_height(gray)
+    if text_height is None or text_height <= target_text_height:
+        return gray
+    scale = target_text_height / text_height
+    # INTER_AREA is only worth its cost for large reductions
+    interpolation = cv2.INTER_AREA if scale < 0.5 else cv2.INTER_LINEAR
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation)
+
+@metrics.timed("ocr_regions")
+def detect_text_regions(processed, min_area_ratio=0.0005, padding=8):
+    """ Bounding boxes (x, y, w, h) of text blocks in a binarized page, in reading order
+
+    Dark text is smeared horizontally with a morphological close so words and
+    lines merge into blocks, then external contours give the blocks. Returns
+    an empty list when the blocks cover most of the page anyway.
+    """
+    height, width = processed.shape[:2]
+    ink = cv2.bitwise_not(processed)
+    ink = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2)))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(15, width // 40), max(5, height // 150)))
+    blocks = cv2.morphologyEx(ink, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(blocks, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area = min_area_ratio * height * width
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < min_area:
+            continue
+        x0, y0 = max(0, x - padding), max(0, y - padding)
+        x1, y1 = min(width, x + w + padding), min(height, y + h + padding)
+        regions.append((x0, y0, x1 - x0, y1 - y0))
+
+    if not regions:
+        return []
+    # Merge lines into paragraphs so Tesseract gets a few blocks, not one call per line
+    line_height = int(np.median([h for _, _, _, h in regions]))
+    regions = _merge_regions(regions, max_gap=line_height)
+
+    covered = sum(w * h for _, _, w, h in regions)
+    if covered > 0.6 * height * width:
+        return []
+    # Top-to-bottom, then left-to-right within roughly the same band
+    band = max(1, height // 50)
+    regions.sort(key=lambda r: (r[1] // band, r[0]))
+    return regions
+
+def _merge_regions(regions, max_gap):
+    """ Union boxes that overlap horizontally and are at most max_gap apart vertically """
+    merged = []
+    for x, y, w, h in sorted(regions, key=lambda r: r[1]):
+        for i, (mx, my, mw, mh) in enumerate(merged):
+            overlaps = x < mx + mw and mx < x + w
+            if overlaps and y - (my + mh) <= max_gap:
+                x0, y0 = min(x, mx), min(y, my)
+                merged[i] = (x0, y0, max(x + w, mx + mw) - x0, max(y + h, my + mh) - y0)
+                break
+        else:
+            merged.append((x, y, w, h))
+    return merged
+
+def ocr_image(processed, parallel=True):
+    """ OCR a preprocessed page, only feeding detected text regions to Tesseract
+
+    Regions are only used with a backend that keeps engines alive (tesserocr);
+    with pytesseract each region would spawn its own tesseract process, so the
+    page goes through in a single call instead.
+    """
+    backend = registry.get("ocr")
+    split = PREPROCESS_PARAMS["detect_regions"] and getattr(backend, "ocr_regions", False)
+    regions = detect_text_regions(processed) if split else []
+    if not regions:
+        return run_ocr(processed)
+
+    crops = [processed[y:y + h, x:x + w] for x, y, w, h in regions]
+    workers = min(len(crops), getattr(backend, "size", os.cpu_count() or 1)) if parallel else 1
+    with metrics.span("tesseract"):
+        if workers <= 1:
+            texts = [backend.image_to_string(crop) for crop in crops]
+        else:
+            # tesserocr releases the GIL, so threads are enough to run regions concurrently
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                texts = list(pool.map(backend.image_to_string, crops))
+    metrics.count("ocr_regions", len(crops))
+    return "\n".join(text.strip() for text in texts if text.strip())
+
+@metrics.timed("ocr_preprocess")
 def preprocess_image(image_path):
     """ Load & preprocess the image for OCR with enhanced techniques """
     try:
-        img = cv2.imread(image_path)
+        img = load_image(image_path)
         if img is None:
-            raise FileNotFoundError(f"Error: Unable to load image {image_path}")
+            source = image_path if isinstance(image_path, str) else "from buffer"
+            raise FileNotFoundError(f"Error: Unable to load image {source}")
         
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        # Bring phone photos down to a sensible text size before the expensive steps
+        gray = normalize_resolution(gray)
 
         # Apply Gaussian Blur before thresholding
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        kernel = PREPROCESS_PARAMS["blur_kernel"]
+        blurred = cv2.GaussianBlur(gray, (kernel, kernel), 0)
 
         # Adaptive thresholding for better results
-        processed = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+        processed = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                          PREPROCESS_PARAMS["threshold_block_size"],
+                                          PREPROCESS_PARAMS["threshold_c"])
 
         return processed
 
@@ -24,13 +288,144 @@ def preprocess_image(image_path):
         print(f"Error processing image: {e}")
         return None
 
+class OcrCache(ContentCache):
+    """ Extracted text keyed by image content + preprocessing/Tesseract settings
+
+    A bounded in-memory LRU, optionally backed by a directory of text files
+    so results survive restarts and are shared between worker processes.
+    """
+    label = "OCR cache"
+
+# Set FLASHCARD_OCR_CACHE_DIR to also keep OCR results on disk
+ocr_cache = OcrCache(
+    max_entries=int(os.environ.get("FLASHCARD_OCR_CACHE_SIZE", 512)),
+    disk_dir=os.environ.get("FLASHCARD_OCR_CACHE_DIR") or None,
+)
+
+def ocr_cache_key(source):
+    """ Hash of the image content plus everything that influences the OCR output """
+    digest = hashlib.sha256()
+    if isinstance(source, np.ndarray):
+        digest.update(str((source.shape, source.dtype.str)).encode())
+        digest.update(np.ascontiguousarray(source).data)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        digest.update(source)
+    else:
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    settings = {"preprocess": PREPROCESS_PARAMS, "config": TESSERACT_CONFIG, "lang": TESSERACT_LANG}
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def _cache_key_or_none(source):
+    try:
+        return ocr_cache_key(source)
+    except OSError:
+        # Unreadable path; preprocess_image reports the error
+        return None
+
 def extract_text(image_path):
     """ Extract text with OCR """
+    if not isinstance(image_path, (str, np.ndarray)):
+        image_path = _as_buffer(image_path)
+    key = _cache_key_or_none(image_path)
+    if key is not None:
+        cached = ocr_cache.get(key)
+        if cached is not None:
+            return cached
+
     processed_img = preprocess_image(image_path)
     if processed_img is None:
         return ""
 
     # Run OCR with optimized settings
-    text = pytesseract.image_to_string(processed_img, config="--psm 6 --oem 3")
+    text = ocr_image(processed_img).strip()
+
+    if key is not None:
+        ocr_cache.put(key, text)
+    return text
+
+def _ocr_page(index, source):
+    """ Preprocess + OCR one page in a worker process, timing each step """
+    start = time.perf_counter()
+    processed_img = preprocess_image(source)
+    preprocessed = time.perf_counter()
+    text = ""
+    ok = False
+    if processed_img is not None:
+        try:
+            # Pages already run in parallel across processes; regions stay sequential
+            text = ocr_image(processed_img, parallel=False).strip()
+            ok = True
+        except Exception as e:
+            print(f"Error running OCR on page {index}: {e}")
+    finished = time.perf_counter()
+    return {
+        "index": index,
+        "text": text,
+        "ok": ok,
+        "cached": False,
+        "preprocess_s": preprocessed - start,
+        "ocr_s": finished - preprocessed,
+        "total_s": finished - start,
+    }
+
+def _init_ocr_worker():
+    # Forked workers must not share engines inherited from the parent; each
+    # worker builds its own on first use and keeps it for its lifetime.
+    registry.unload("ocr")
+
+def extract_text_batch(paths_or_buffers, max_workers=None, ordered=True):
+    """ OCR many pages across a process pool, yielding each result as it is ready
+
+    Each result is a dict with the page index, extracted text and per-page
+    timings. With ordered=True pages are yielded in input order (each page as
+    soon as it and all earlier pages are done); otherwise in completion order.
+    max_workers defaults to FLASHCARD_OCR_WORKERS or the CPU count. Pages
+    already in the OCR cache are answered without reaching the pool.
+    """
+    # Worker processes need picklable inputs, so buffers and file objects become bytes
+    sources = []
+    for source in paths_or_buffers:
+        if not isinstance(source, (str, np.ndarray)):
+            source = _as_buffer(source)
+            if isinstance(source, (bytearray, memoryview)):
+                source = bytes(source)
+        sources.append(source)
+    if not sources:
+        return
+
+    keys = [_cache_key_or_none(source) for source in sources]
+    cached = {}
+    for index, key in enumerate(keys):
+        text = ocr_cache.get(key) if key is not None else None
+        if text is not None:
+            cached[index] = {"index": index, "text": text, "ok": True, "cached": True,
+                             "preprocess_s": 0.0, "ocr_s": 0.0, "total_s": 0.0}
+    pending = [index for index in range(len(sources)) if index not in cached]
+
+    def finish(result):
+        key = keys[result["index"]]
+        if result["ok"] and key is not None:
+            ocr_cache.put(key, result["text"])
+        return result
+
+    if max_workers is None:
+        max_workers = int(os.environ.get("FLASHCARD_OCR_WORKERS", 0)) or os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(pending)))
+
+    if max_workers == 1:
+        for index in range(len(sources)):
+            yield cached[index] if index in cached else finish(_ocr_page(index, sources[index]))
+        return
 
-    return text.strip()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_ocr_worker) as pool:
+        futures = {index: pool.submit(_ocr_page, index, sources[index]) for index in pending}
+        if ordered:
+            for index in range(len(sources)):
+                yield cached[index] if index in cached else finish(futures[index].result())
+        else:
+            yield from cached.values()
+            for future in as_completed(futures.values()):
+                yield finish(future.result())
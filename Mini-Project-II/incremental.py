@@ -0,0 +1,207 @@
+import threading
+from functools import partial
+
+import numpy as np
+
+import metrics
+from dedupe import dedupe_sentences
+from flashcard import (determine_flashcard_count, embed_sentences, generate_flashcards_stream, preprocess_texts,
+                       select_flashcards, split_into_sections)
+from ranking import knn_neighbours, knn_similarity_graph, neighbour_graph, normalize_rows, pagerank
+
+
+class IncrementalDeck:
+    """ Per-session generation state, so resubmitting an edited text only redoes what changed
+
+    Keeps the segmented paragraphs, the normalized sentence vectors, each
+    sentence's top-k neighbour list and the PageRank scores of the last run.
+    On the next text:
+      - only new or edited paragraphs go through spaCy and MinHash,
+      - only new sentences are embedded and compared against the whole set,
+      - unchanged sentences merge the new ones into their neighbour lists
+        (a row is rescanned in full only if one of its neighbours was deleted),
+      - PageRank is warm-started from the previous scores.
+    The similarity graph is the same one rank_sentences builds from scratch.
+    Long texts are streamed through stream(), which leaves the same state
+    behind, so later edits of a long document are incremental as well.
+    """
+
+    def __init__(self, k=32):
+        self.k = k
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.text = None
+        self.paragraphs = {}   # paragraph text -> its sentences
+        self.signatures = {}   # sentence -> MinHash signature for near-duplicate checks
+        self.sentences = []
+        self.vectors = None    # L2-normalized embeddings, one row per sentence
+        self.top = None        # (n, k + 1) neighbour indices; None for the dense small-n graph
+        self.top_vals = None
+        self.scores = None
+        self.flashcards = {}
+
+    @property
+    def has_state(self):
+        return self.vectors is not None
+
+    def overlap(self, text):
+        """ Fraction of text's paragraphs that were already in the previous text (0.0 without state) """
+        paragraphs = [p for p in text.split("\n\n") if p.strip()]
+        if not self.has_state or not paragraphs:
+            return 0.0
+        return sum(p in self.paragraphs for p in paragraphs) / len(paragraphs)
+
+    def _segment(self, text):
+        paragraphs = [p for p in text.split("\n\n") if p.strip()]
+        new = [p for p in dict.fromkeys(paragraphs) if p not in self.paragraphs]
+        segmented = dict(zip(new, preprocess_texts(new))) if new else {}
+        metrics.count("paragraphs_segmented", len(new))
+        self.paragraphs = {p: self.paragraphs[p] if p in self.paragraphs else segmented[p] for p in paragraphs}
+        return [s for p in paragraphs for s in self.paragraphs[p]]
+
+    def _segment_sections(self, chunks, paragraphs, max_sentences):
+        """ iter_section_sentences, but segmenting paragraph by paragraph into paragraphs (reusing known ones) """
+        for chunk in chunks:
+            parts = [p for p in chunk.split("\n\n") if p.strip()]
+            new = [p for p in dict.fromkeys(parts) if p not in paragraphs and p not in self.paragraphs]
+            segmented = dict(zip(new, preprocess_texts(new))) if new else {}
+            metrics.count("paragraphs_segmented", len(new))
+            for p in parts:
+                if p not in paragraphs:
+                    paragraphs[p] = segmented[p] if p in segmented else self.paragraphs[p]
+            sentences = [s for p in parts for s in paragraphs[p]]
+            metrics.count("sentences", len(sentences))
+            for start in range(0, len(sentences), max_sentences):
+                part = sentences[start:start + max_sentences]
+                yield " ".join(part), part
+
+    def stream(self, text, sections=None, sink=None):
+        """ generate_flashcards_stream over text's sections that keeps this deck's state
+
+        Yields the same per-section cards. Each section's sentences and vectors
+        are kept (and passed on to sink), and once the last section is out the
+        neighbour lists and PageRank scores are built, so the next edit of the
+        text goes through generate() incrementally.
+        """
+        with self._lock:
+            paragraphs, signatures, kept, vectors = {}, {}, [], []
+
+            def keep(sentences, embeddings):
+                kept.extend(sentences)
+                vectors.append(normalize_rows(embeddings))
+                if sink is not None:
+                    sink(sentences, embeddings)
+
+            sections = split_into_sections(text) if sections is None else sections
+            flashcards = {}
+            for section_cards in generate_flashcards_stream(
+                    iter(sections), sink=keep, total_words=len(text.split()),
+                    segment=partial(self._segment_sections, paragraphs=paragraphs), signature_cache=signatures):
+                flashcards.update(section_cards)
+                yield section_cards
+
+            self.reset()
+            if not kept:
+                return
+            X = np.concatenate(vectors)
+            del vectors[:]
+            with metrics.span("similarity"):
+                if len(kept) <= self.k + 1:
+                    graph = knn_similarity_graph(X, k=self.k)
+                else:
+                    self.top, self.top_vals = knn_neighbours(X, np.arange(len(kept)), self.k + 1)
+                    graph = neighbour_graph(self.top, self.top_vals)
+            self.scores = pagerank(graph)
+            self.text, self.paragraphs, self.signatures = text, paragraphs, signatures
+            self.sentences, self.vectors, self.flashcards = kept, X, flashcards
+
+    def _update_neighbours(self, vectors, old_rows, added):
+        n, keep = vectors.shape[0], self.k + 1
+        top = np.empty((n, keep), dtype=np.int64)
+        top_vals = np.empty((n, keep), dtype=np.float32)
+        recompute = np.zeros(n, dtype=bool)
+        recompute[added] = True
+        kept = np.flatnonzero(~recompute)
+
+        if self.top is None or not len(kept) or 2 * len(added) > n:
+            recompute[:] = True
+        else:
+            new_index = np.full(len(self.sentences), -1, dtype=np.int64)
+            new_index[old_rows[kept]] = kept
+            kept_top = new_index[self.top[old_rows[kept]]]
+            # A deleted neighbour leaves a gap that only a full row scan can fill
+            broken = (kept_top < 0).any(axis=1)
+            recompute[kept[broken]] = True
+            kept, kept_top = kept[~broken], kept_top[~broken]
+            kept_vals = self.top_vals[old_rows[kept]]
+            if len(added):
+                candidates = np.concatenate([kept_top, np.broadcast_to(added, (len(kept), len(added)))], axis=1)
+                candidate_vals = np.concatenate([kept_vals, vectors[kept] @ vectors[added].T], axis=1)
+                best = np.argpartition(candidate_vals, -keep, axis=1)[:, -keep:]
+                kept_top = np.take_along_axis(candidates, best, axis=1)
+                kept_vals = np.take_along_axis(candidate_vals, best, axis=1)
+            top[kept] = kept_top
+            top_vals[kept] = kept_vals
+
+        rows = np.flatnonzero(recompute)
+        if len(rows):
+            top[rows], top_vals[rows] = knn_neighbours(vectors, rows, keep)
+        metrics.count("neighbour_rows_rescanned", len(rows))
+        return top, top_vals
+
+    def generate(self, text):
+        """ Same cards as generate_flashcards(text), reusing the previous run's work """
+        with self._lock:
+            if text == self.text:
+                return dict(self.flashcards)
+
+            segmented = self._segment(text)
+            sentences = dedupe_sentences(segmented, signature_cache=self.signatures)
+            # Dedupe skips hashing (single sentence, threshold 0), so not every sentence has a signature
+            self.signatures = {s: self.signatures[s] for s in segmented if s in self.signatures}
+            if not sentences:
+                self.reset()
+                return {}
+
+            previous = {s: i for i, s in enumerate(self.sentences)}
+            old_rows = np.array([previous.get(s, -1) for s in sentences], dtype=np.int64)
+            reused = old_rows >= 0
+            added = np.flatnonzero(~reused)
+            metrics.count("sentences_reused", int(reused.sum()))
+
+            new_vectors = None
+            if len(added):
+                new_vectors = embed_sentences([sentences[i] for i in added])
+                if new_vectors is None:
+                    return {}
+                new_vectors = normalize_rows(new_vectors)
+            dim = new_vectors.shape[1] if new_vectors is not None else self.vectors.shape[1]
+            vectors = np.empty((len(sentences), dim), dtype=np.float32)
+            if reused.any():
+                vectors[reused] = self.vectors[old_rows[reused]]
+            if new_vectors is not None:
+                vectors[added] = new_vectors
+
+            if len(sentences) <= self.k + 1:
+                top = top_vals = None
+                graph = knn_similarity_graph(vectors, k=self.k)
+            else:
+                with metrics.span("similarity"):
+                    top, top_vals = self._update_neighbours(vectors, old_rows, added)
+                    graph = neighbour_graph(top, top_vals)
+
+            x0 = None
+            if self.scores is not None and reused.any():
+                x0 = np.full(len(sentences), 1.0 / len(sentences))
+                x0[reused] = self.scores[old_rows[reused]]
+            scores = pagerank(graph, x0=x0)
+
+            selected = select_flashcards(sentences, scores, determine_flashcard_count(text), embeddings=vectors)
+            flashcards = {f"Point {i+1}": point for i, point in enumerate(selected)}
+
+            self.text, self.sentences, self.vectors = text, sentences, vectors
+            self.top, self.top_vals, self.scores = top, top_vals, scores
+            self.flashcards = flashcards
+            return dict(flashcards)
@@ -0,0 +1,269 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from flashcard import generate_flashcards, generate_flashcards_stream, generation_settings, split_into_sections
+from deck_store import deck_store
+from card_search import index_deck
+from image_processing import extract_text
+import metrics
+
+# Texts longer than this are generated section by section so partial cards show up early
+STREAMING_WORD_THRESHOLD = 2000
+# Share of a long text's paragraphs the session's previous text must contain to regenerate incrementally
+INCREMENTAL_MIN_OVERLAP = 0.5
+
+
+class Job:
+    """ State of one background task, polled by the UI between script runs """
+
+    def __init__(self, kind, key):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = "queued"  # queued -> running -> done | failed
+        self.progress = 0.0
+        self.message = ""
+        self.partial = {}
+        self.result = None
+        self.error = None
+        self.timings = {}
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def update(self, progress=None, message=None, partial=None):
+        """ Called from the worker to publish progress and partial results """
+        with self._lock:
+            if progress is not None:
+                self.progress = progress
+            if message is not None:
+                self.message = message
+            if partial:
+                self.partial.update(partial)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "progress": self.progress,
+                "message": self.message,
+                "partial": dict(self.partial),
+                "result": self.result,
+                "error": self.error,
+                "timings": dict(self.timings),
+            }
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+
+class JobQueue:
+    """ Process-wide worker pool for generation/OCR jobs shared by every session
+
+    Submitting the same input while an identical job is still queued or
+    running returns the existing job id instead of starting new work.
+    Finished jobs are kept for keep_seconds so sessions can collect them.
+    """
+
+    def __init__(self, max_workers=2, keep_seconds=600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._in_flight = {}  # dedupe key -> job id
+        self._lock = threading.Lock()
+        self.keep_seconds = keep_seconds
+
+    def submit(self, kind, fn, *args, key=None):
+        """ Run fn(job, *args) in the background and return the job id """
+        with self._lock:
+            self._prune()
+            if key is not None and key in self._in_flight:
+                return self._in_flight[key]
+            job = Job(kind, key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._in_flight[key] = job.id
+        self._executor.submit(self._run, job, fn, args)
+        return job.id
+
+    def _run(self, job, fn, args):
+        with job._lock:
+            job.status = "running"
+        try:
+            with metrics.trace() as trace:
+                result = fn(job, *args)
+            with job._lock:
+                job.timings = trace.breakdown()
+                job.result = result
+                job.progress = 1.0
+                job.status = "done"
+        except Exception as e:
+            print(f"Error in {job.kind} job {job.id}: {e}")
+            with job._lock:
+                job.error = str(e)
+                job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if job.key is not None and self._in_flight.get(job.key) == job.id:
+                    del self._in_flight[job.key]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {"jobs": counts, "in_flight": len(self._in_flight)}
+
+
+job_queue = JobQueue(max_workers=int(os.environ.get("FLASHCARD_JOB_WORKERS", 2)))
+
+
+def _content_key(kind, payload):
+    data = payload.encode("utf-8") if isinstance(payload, str) else bytes(payload)
+    return f"{kind}:{hashlib.sha1(data).hexdigest()}"
+
+
+def _save_section(state, sentences, embeddings):
+    """ Stream sink: append a section to the pending deck, giving up on the deck after a database error """
+    if state.get("pending") is None:
+        return
+    try:
+        deck_store.append_sentences(state["pending"], sentences, embeddings)
+    except sqlite3.Error as e:
+        print(f"Error saving deck: {e}")
+        _discard(state)
+
+
+def _discard(state):
+    """ Delete the pending deck of a streamed text that will not be published """
+    if state.get("pending") is not None:
+        try:
+            deck_store.delete(state["pending"])
+        except sqlite3.Error as e:
+            print(f"Error discarding deck: {e}")
+        state["pending"] = None
+
+
+def _generate(job, text, deck, source=None):
+    """ (flashcards, state) for text
+
+    state holds the "sentences" and "embeddings" to store with the deck, or,
+    for a streamed text, the "pending" deck store id its sections were
+    already written to (None when there is nothing to publish).
+    """
+    state = {}
+    short = len(text.split()) <= STREAMING_WORD_THRESHOLD
+    # Long texts only take the incremental path when they are mostly an edit of the previous one;
+    # anything else streams, so partial cards show up and the job holds one section at a time
+    # (the session deck keeps only the vectors it needs for later edits)
+    if deck is not None and (short or deck.overlap(text) >= INCREMENTAL_MIN_OVERLAP):
+        job.update(message="Updating flashcards..." if deck.has_state else "Generating flashcards...")
+        flashcards = deck.generate(text)
+        state.update(sentences=deck.sentences, embeddings=deck.vectors)
+        return flashcards, state
+    if short:
+        job.update(message="Generating flashcards...")
+        return generate_flashcards(text, state=state), state
+
+    state["pending"] = None
+    if deck_store is not None:
+        try:
+            state["pending"] = deck_store.begin(source)
+        except sqlite3.Error as e:
+            print(f"Error saving deck: {e}")
+    sections = list(split_into_sections(text))
+    flashcards = {}
+    # One card budget for the whole text, shared out across the sections; each
+    # section's sentences go to the deck store as they are produced, not kept here
+    sink = partial(_save_section, state) if state["pending"] is not None else None
+    if deck is not None:
+        # The session deck keeps what it needs so the next edit of this text is incremental
+        stream = deck.stream(text, sections, sink=sink)
+    else:
+        stream = generate_flashcards_stream(iter(sections), sink=sink, total_words=len(text.split()))
+    try:
+        for done, section_cards in enumerate(stream, start=1):
+            flashcards.update(section_cards)
+            job.update(progress=min(done / len(sections), 0.99), partial=section_cards,
+                       message=f"{len(flashcards)} cards so far")
+    except Exception:
+        _discard(state)
+        raise
+    return flashcards, state
+
+
+def generation_task(job, text, deck=None, source=None):
+    """ Generate a deck, publishing cards section by section for long texts
+
+    Texts already in the deck store are answered from it without running the
+    pipeline. With a session's IncrementalDeck, an edited resubmission only
+    recomputes the changed sentences instead of streaming the whole text again;
+    a long text streamed once leaves the deck ready for that.
+    """
+    settings = generation_settings()
+    if deck_store is not None:
+        stored = deck_store.get(text, settings)
+        if stored is not None:
+            metrics.count("deck_store_hits")
+            return {"flashcards": stored["flashcards"], "text": text, "stored": True}
+
+    flashcards, state = _generate(job, text, deck, source)
+    if deck_store is not None and flashcards:
+        try:
+            if "pending" not in state:
+                saved = deck_store.put(text, flashcards, state.get("sentences"), state.get("embeddings"),
+                                       source=source, settings=settings)
+            elif state["pending"] is not None:
+                saved = deck_store.finish(state["pending"], text, flashcards, settings)
+            else:
+                saved = None  # a section could not be written, so the deck is not stored
+            if saved is not None:
+                index_deck(*saved)
+        except sqlite3.Error as e:
+            print(f"Error saving deck: {e}")
+            _discard(state)
+    elif not flashcards:
+        _discard(state)
+    return {"flashcards": flashcards, "text": text}
+
+
+def ocr_generation_task(job, image_bytes):
+    """ OCR an uploaded image, then generate its deck """
+    job.update(message="Extracting text...")
+    text = extract_text(image_bytes)
+    if not text:
+        return {"flashcards": {}, "text": ""}
+    job.update(progress=0.3, message="Generating flashcards...")
+    return generation_task(job, text, source="image")
+
+
+def submit_generation(text, deck=None):
+    # Keyed by content only: a session submitting text that another session's job is already
+    # generating joins that job; otherwise the new job runs on this session's incremental deck
+    return job_queue.submit("generate", generation_task, text, deck, "text",
+                            key=_content_key("generate", text))
+
+
+def submit_image_generation(image_bytes):
+    image_bytes = bytes(image_bytes)
+    return job_queue.submit("ocr", ocr_generation_task, image_bytes, key=_content_key("ocr", image_bytes))
@@ -1,9 +1,12 @@
 import streamlit as st
-from flashcard import generate_flashcards, get_flashcard_word_count
+from flashcard import generate_flashcards, get_flashcard_word_count, warm_up_models
 from image_processing import extract_text
-from text_to_speech import text_to_speech
+from text_to_speech import audio_mime_type, prefetch, synthesize_async
 import random
 
+# Cards ahead of the current one whose audio is synthesized in the background
+AUDIO_PREFETCH = 3
+
 # Page configuration
 st.set_page_config(
     page_title="Smart Flashcard Generator",
@@ -12,6 +15,13 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Load models once per process; every session shares the same instances
+@st.cache_resource(show_spinner="Loading models...")
+def load_models():
+    warm_up_models()
+
+load_models()
+
 # Initialize session state variables
 if 'flashcards' not in st.session_state:
     st.session_state.flashcards = {}
@@ -119,10 +129,8 @@ with col1:
             if submit_button:
                 if uploaded_file is not None:
                     with st.spinner("Processing image and generating flashcards..."):
-                        image_path = f"temp_{uploaded_file.name}"
-                        with open(image_path, "wb") as f:
-                            f.write(uploaded_file.getbuffer())
-                        extracted_text = extract_text(image_path)
+                        # Decoded straight from the upload buffer; no temp file
+                        extracted_text = extract_text(uploaded_file)
                         flashcards = generate_flashcards(extracted_text)
                         if flashcards is not None:
                             st.session_state.flashcards = flashcards
@@ -178,8 +186,10 @@ with col2:
         with col_middle:
             if st.button("🔊 Read Aloud", key="audio_btn"):
                 with st.spinner("Converting to speech..."):
-                    text_to_speech(values[current_index])
-                    st.success("Audio saved as 'flashcard.mp3'")
+                    try:
+                        st.audio(synthesize_async(values[current_index]).result(), format=audio_mime_type())
+                    except Exception as e:
+                        st.warning(f"Speech synthesis failed: {e}")
 
         with col_right:
             if st.button("Next ➡️", key="next_btn", disabled=current_index == len(flashcards) - 1):
@@ -188,6 +198,9 @@ with col2:
 
         st.markdown('</div>', unsafe_allow_html=True)
 
+        # Warm the audio cache for the upcoming cards so "Read Aloud" is instant
+        prefetch(values[current_index:current_index + AUDIO_PREFETCH + 1])
+
         with st.expander("Show Key Phrase"):
             st.write(f"**Key Phrase:** {keys[current_index]}")
     else:
@@ -0,0 +1,170 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# FLASHCARD_METRICS=0 turns every span into a shared no-op context manager
+ENABLED = os.environ.get("FLASHCARD_METRICS", "1") != "0"
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NOOP = nullcontext()
+_lock = threading.Lock()
+_stages = {}    # stage -> {"count", "sum", "buckets"}
+_counters = {}  # name -> value
+_current_trace = contextvars.ContextVar("flashcard_trace", default=None)
+
+
+class Trace:
+    """ Timing breakdown of one request: total seconds and calls per stage """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def record(self, stage, seconds):
+        entry = self.stages.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def breakdown(self):
+        """ {stage: {"seconds", "calls"}} plus the wall time of the whole request """
+        result = {stage: {"seconds": round(seconds, 4), "calls": calls}
+                  for stage, (seconds, calls) in self.stages.items()}
+        total = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        result["total"] = {"seconds": round(total, 4), "calls": 1}
+        return result
+
+
+def _observe(stage, seconds):
+    with _lock:
+        entry = _stages.get(stage)
+        if entry is None:
+            entry = _stages[stage] = {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS)}
+        entry["count"] += 1
+        entry["sum"] += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                entry["buckets"][i] += 1
+                break
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(stage, seconds)
+
+
+@contextmanager
+def _timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _observe(stage, time.perf_counter() - start)
+
+
+def span(stage):
+    """ Context manager timing a pipeline stage (no-op when metrics are disabled) """
+    if not ENABLED:
+        return _NOOP
+    return _timed(stage)
+
+
+def timed(stage):
+    """ Decorator form of span() for functions that are a stage as a whole """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _timed(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """ Increment a process-wide counter (and the current request's copy) """
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + value
+
+
+@contextmanager
+def trace():
+    """ Collect a per-request breakdown of every span entered inside the block """
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        current.elapsed = time.perf_counter() - current.started
+        _current_trace.reset(token)
+
+
+def snapshot():
+    with _lock:
+        return {
+            "stages": {stage: {"count": e["count"], "sum": e["sum"]} for stage, e in _stages.items()},
+            "counters": dict(_counters),
+        }
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def prometheus_text(prefix="flashcard"):
+    """ Render all stages and counters in the Prometheus text exposition format """
+    lines = []
+    with _lock:
+        if _stages:
+            name = f"{prefix}_stage_seconds"
+            lines.append(f"# HELP {name} Time spent in each pipeline stage.")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, entry in sorted(_stages.items()):
+                cumulative = 0
+                for bound, hits in zip(BUCKETS, entry["buckets"]):
+                    cumulative += hits
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {entry["count"]}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {entry["sum"]:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {entry["count"]}')
+        for counter, value in sorted(_counters.items()):
+            name = f"{prefix}_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="0.0.0.0"):
+    """ Serve /metrics for Prometheus scraping from a daemon thread """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,115 @@
+import gc
+import os
+import sys
+import threading
+import time
+
+import metrics
+
+
+def resident_memory_mb():
+    """ Current resident set size of this process in megabytes """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes elsewhere
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        return 0.0
+
+
+class ModelRegistry:
+    """ Process-wide, thread-safe store of lazily loaded models """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaders = {}
+        self._models = {}
+        self._load_locks = {}
+        self._stats = {}
+
+    def register(self, name, loader):
+        """ Register a zero-argument loader under name (does not load it) """
+        with self._lock:
+            self._loaders[name] = loader
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        """ Return the model for name, loading it once on first use """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            if name not in self._loaders:
+                raise KeyError(f"No model registered under '{name}'")
+            load_lock = self._load_locks[name]
+
+        # Per-model lock so overlapping sessions wait for a single load
+        # instead of each building their own copy.
+        with load_lock:
+            model = self._models.get(name)
+            if model is not None:
+                return model
+
+            rss_before = resident_memory_mb()
+            start = time.perf_counter()
+            with metrics.span("model_load"):
+                model = self._loaders[name]()
+            elapsed = time.perf_counter() - start
+            rss_after = resident_memory_mb()
+
+            with self._lock:
+                self._models[name] = model
+                stats = self._stats.setdefault(name, {"loads": 0})
+                stats["loads"] += 1
+                stats["load_time_s"] = elapsed
+                stats["memory_mb"] = max(rss_after - rss_before, 0.0)
+                stats["loaded_at"] = time.time()
+            return model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def warm_up(self, names=None):
+        """ Load the given models (all registered ones by default) up front """
+        if names is None:
+            with self._lock:
+                names = list(self._loaders)
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Error warming up model '{name}': {e}")
+
+    def unload(self, name=None):
+        """ Drop one model (or every model) so its memory can be reclaimed """
+        with self._lock:
+            names = [name] if name is not None else list(self._models)
+            for n in names:
+                self._models.pop(n, None)
+        gc.collect()
+
+    def stats(self):
+        """ Load time and memory for each registered model plus process RSS """
+        with self._lock:
+            models = {}
+            for name in self._loaders:
+                entry = dict(self._stats.get(name, {"loads": 0}))
+                entry["loaded"] = name in self._models
+                models[name] = entry
+        return {"models": models, "process_rss_mb": resident_memory_mb()}
+
+
+registry = ModelRegistry()
@@ -0,0 +1,134 @@
+import numpy as np
+from scipy import sparse
+
+import metrics
+
+
+def normalize_rows(embeddings):
+    """ L2-normalize embeddings as float32 so dot products are cosine similarities """
+    X = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return X / norms
+
+
+@metrics.timed("similarity")
+def knn_similarity_graph(embeddings, k=32, block_size=1024):
+    """ Build a symmetric CSR graph holding each sentence's k most similar neighbours
+
+    Similarities are computed in row blocks of block_size, so memory stays at
+    O(block_size * N + N * k) rather than O(N^2). When every sentence fits in
+    its own neighbourhood (N <= k + 1) the full cosine matrix is returned,
+    which is exactly the graph the dense path used to build.
+    """
+    X = normalize_rows(embeddings)
+    n = X.shape[0]
+    if n == 0:
+        return sparse.csr_matrix((0, 0), dtype=np.float32)
+
+    if n <= k + 1:
+        return sparse.csr_matrix(X @ X.T)
+
+    # Each row keeps itself plus k neighbours, mirroring the self-loops of the dense graph
+    top, top_vals = knn_neighbours(X, np.arange(n), k + 1, block_size)
+    return neighbour_graph(top, top_vals)
+
+
+def knn_neighbours(X, rows, keep, block_size=1024):
+    """ Indices and similarities of the keep most similar rows of X (self included) for each row in rows
+
+    X must already be L2-normalized. Returns two (len(rows), keep) arrays.
+    """
+    top = np.empty((len(rows), keep), dtype=np.int64)
+    top_vals = np.empty((len(rows), keep), dtype=np.float32)
+    for start in range(0, len(rows), block_size):
+        stop = min(start + block_size, len(rows))
+        block = X[rows[start:stop]] @ X.T
+        block[np.arange(stop - start), rows[start:stop]] = np.inf  # always keep self
+        block_top = np.argpartition(block, -keep, axis=1)[:, -keep:]
+        block_vals = np.take_along_axis(block, block_top, axis=1)
+        block_vals[np.isinf(block_vals)] = 1.0
+        top[start:stop] = block_top
+        top_vals[start:stop] = block_vals
+    return top, top_vals
+
+
+def neighbour_graph(top, top_vals):
+    """ Symmetric CSR graph from per-row neighbour lists (row i of top lists sentence i's neighbours) """
+    n, keep = top.shape
+    vals = top_vals.ravel().astype(np.float32)
+    # Negative similarities carry no useful "endorsement" for PageRank
+    np.clip(vals, 0.0, None, out=vals)
+    graph = sparse.csr_matrix((vals, (np.repeat(np.arange(n), keep), top.ravel())), shape=(n, n))
+    graph.eliminate_zeros()
+    # The similarity graph is undirected: keep an edge if either endpoint chose it
+    return graph.maximum(graph.T).tocsr()
+
+
+@metrics.timed("ranking")
+def pagerank(graph, alpha=0.85, tol=1.0e-6, max_iter=100, x0=None):
+    """ Weighted PageRank by power iteration on a sparse adjacency matrix
+
+    Follows the same conventions as networkx.pagerank (row-normalized weights,
+    uniform teleport and dangling redistribution, L1 stopping rule of N * tol),
+    so it gives the same scores on the same graph. x0 warm-starts the iteration.
+    """
+    n = graph.shape[0]
+    if n == 0:
+        return np.zeros(0)
+
+    A = sparse.csr_matrix(graph, dtype=np.float64)
+    out_weight = np.asarray(A.sum(axis=1)).ravel()
+    inv = np.zeros_like(out_weight)
+    nonzero = out_weight != 0
+    inv[nonzero] = 1.0 / out_weight[nonzero]
+    # Row-stochastic transpose so each step is a single sparse mat-vec
+    P_T = (sparse.diags(inv) @ A).T.tocsr()
+    dangling = ~nonzero
+
+    p = np.full(n, 1.0 / n)
+    if x0 is None:
+        x = p.copy()
+    else:
+        x = np.asarray(x0, dtype=np.float64)
+        x = x / x.sum()
+
+    for _ in range(max_iter):
+        xlast = x
+        x = alpha * (P_T @ xlast + xlast[dangling].sum() * p) + (1 - alpha) * p
+        if np.abs(x - xlast).sum() < n * tol:
+            return x
+    print(f"PageRank did not converge in {max_iter} iterations; using last estimate.")
+    return x
+
+
+def rank_sentences(embeddings, k=32, block_size=1024, x0=None):
+    """ PageRank score per sentence over its top-k cosine similarity graph """
+    graph = knn_similarity_graph(embeddings, k=k, block_size=block_size)
+    return pagerank(graph, x0=x0)
+
+
+def iter_mmr(embeddings, scores, diversity=0.3):
+    """ Yield sentence indices in Maximal Marginal Relevance order
+
+    Each pick maximises (1 - diversity) * relevance - diversity * (highest
+    cosine similarity to anything already picked), with relevance being the
+    score rescaled to [0, 1]. The running maximum similarity is updated with
+    one matrix-vector product per pick, so k picks cost O(N * k) and no
+    similarity matrix is built. diversity=0 reproduces plain score order.
+    """
+    X = normalize_rows(embeddings)
+    relevance = np.asarray(scores, dtype=np.float32)
+    if relevance.size == 0:
+        return
+    span = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / span if span > 0 else np.ones_like(relevance)
+    max_similarity = np.zeros_like(relevance)
+    available = np.ones(relevance.shape[0], dtype=bool)
+    for _ in range(relevance.shape[0]):
+        objective = (1.0 - diversity) * relevance - diversity * max_similarity
+        objective[~available] = -np.inf
+        pick = int(np.argmax(objective))
+        available[pick] = False
+        yield pick
+        np.maximum(max_similarity, X @ X[pick], out=max_similarity)
@@ -1,6 +1,270 @@
-from gtts import gTTS
+import hashlib
+import io
+import json
 import os
 import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from content_cache import ContentCache
+from model_registry import registry
+
+try:
+    from gtts import gTTS
+except ImportError:
+    gTTS = None
+
+DEFAULT_LANG = "en"
+# Speech engine (FLASHCARD_TTS_ENGINE): "gtts" (Google, needs network),
+# "espeak" or "pyttsx3" (both fully offline)
+DEFAULT_ENGINE = os.environ.get("FLASHCARD_TTS_ENGINE", "gtts")
+
+class GTTSEngine:
+    """ Google Translate TTS; one network round-trip per card """
+    name = "gtts"
+    format = "mp3"
+
+    def __init__(self):
+        if gTTS is None:
+            raise ImportError("gTTS is not installed")
+
+    def synthesize(self, text, lang):
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang).write_to_fp(buffer)
+        return buffer.getvalue()
+
+class EspeakEngine:
+    """ Offline synthesis through the espeak-ng / espeak command line (WAV on stdout) """
+    name = "espeak"
+    format = "wav"
+
+    def __init__(self):
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+        if self.binary is None:
+            raise ImportError("espeak-ng / espeak is not installed")
+
+    def synthesize(self, text, lang):
+        result = subprocess.run([self.binary, "-v", lang, "--stdout"], input=text.encode("utf-8"),
+                                capture_output=True, check=True)
+        return result.stdout
+
+class Pyttsx3Engine:
+    """ Offline synthesis through pyttsx3 (the platform's native speech engine) """
+    name = "pyttsx3"
+    format = "wav"
+
+    def __init__(self):
+        import pyttsx3
+        self._engine = pyttsx3.init()
+        # pyttsx3 drives a single native engine and is not thread-safe
+        self._lock = threading.Lock()
+        self._lang = None
+
+    def _select_voice(self, lang):
+        if lang == self._lang:
+            return
+        for voice in self._engine.getProperty("voices"):
+            languages = [l.decode("utf-8", "ignore") if isinstance(l, bytes) else str(l)
+                         for l in (getattr(voice, "languages", None) or [])]
+            if any(lang in l for l in languages) or lang in voice.id:
+                self._engine.setProperty("voice", voice.id)
+                break
+        self._lang = lang
+
+    def synthesize(self, text, lang):
+        with self._lock, tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "card.wav")
+            self._select_voice(lang)
+            self._engine.save_to_file(text, path)
+            self._engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+
+ENGINES = {engine.name: engine for engine in (GTTSEngine, EspeakEngine, Pyttsx3Engine)}
+
+for _name, _engine_cls in ENGINES.items():
+    registry.register(f"tts:{_name}", _engine_cls)
+
+def get_engine(name=None):
+    """ Shared instance of the named speech engine, created on first use """
+    name = name or DEFAULT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown TTS engine '{name}', expected one of {sorted(ENGINES)}")
+    return registry.get(f"tts:{name}")
+
+def audio_mime_type(engine=None):
+    return f"audio/{ENGINES[engine or DEFAULT_ENGINE].format}"
+
+class AudioCache(ContentCache):
+    """ Synthesized audio keyed by (text, language, engine)
+
+    Keeps a bounded in-memory LRU of audio bytes and, when disk_dir is set,
+    one content-addressed file per card that survives restarts.
+    """
+    binary = True
+    extension = "mp3"
+    label = "audio cache"
+
+    def __init__(self, max_entries=256, disk_dir=None):
+        super().__init__(max_entries, disk_dir)
+
+    @staticmethod
+    def key(text, lang, engine):
+        normalized = " ".join(text.split())
+        return hashlib.sha1(f"{engine}\0{lang}\0{normalized}".encode("utf-8")).hexdigest()
+
+# Set FLASHCARD_TTS_CACHE_DIR to keep one audio file per card on disk
+audio_cache = AudioCache(
+    max_entries=int(os.environ.get("FLASHCARD_TTS_CACHE_SIZE", 256)),
+    disk_dir=os.environ.get("FLASHCARD_TTS_CACHE_DIR") or None,
+)
+
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("FLASHCARD_TTS_WORKERS", 4)),
+                               thread_name_prefix="tts")
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+def synthesize(text, lang=DEFAULT_LANG, engine=None):
+    """ Return audio bytes for text (format per engine), synthesizing only on a cache miss """
+    engine = engine or DEFAULT_ENGINE
+    extension = ENGINES[engine].format
+    key = AudioCache.key(text, lang, engine)
+    audio = audio_cache.get(key, extension)
+    if audio is None:
+        audio = get_engine(engine).synthesize(text, lang)
+        audio_cache.put(key, audio, extension)
+    return audio
+
+def synthesize_async(text, lang=DEFAULT_LANG, engine=None):
+    """ Synthesize on the background executor; identical in-flight requests share a future """
+    engine = engine or DEFAULT_ENGINE
+    key = AudioCache.key(text, lang, engine)
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            return future
+        future = _executor.submit(synthesize, text, lang, engine)
+        _in_flight[key] = future
+    future.add_done_callback(lambda _: _forget(key))
+    return future
+
+def _forget(key):
+    with _in_flight_lock:
+        _in_flight.pop(key, None)
+
+def prefetch(texts, lang=DEFAULT_LANG, engine=None):
+    """ Start synthesizing upcoming cards in the background so playback is instant """
+    for text in texts:
+        if text and text.strip():
+            synthesize_async(text, lang, engine)
+
+_MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def mp3_duration(data):
+    """ Duration in seconds of MPEG Layer III audio, from its frame headers """
+    pos = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + size
+    seconds = 0.0
+    while pos + 4 <= len(data):
+        header = int.from_bytes(data[pos:pos + 4], "big")
+        version = (header >> 19) & 0x3
+        layer = (header >> 17) & 0x3
+        bitrate_index = (header >> 12) & 0xF
+        rate_index = (header >> 10) & 0x3
+        if (header >> 21) != 0x7FF or version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+            pos += 1  # not a Layer III frame header; resync
+            continue
+        table = 1 if version == 3 else 2
+        bitrate = _MP3_BITRATES[table][bitrate_index] * 1000
+        sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+        samples = 1152 if version == 3 else 576
+        padding = (header >> 9) & 0x1
+        pos += samples // 8 * bitrate // sample_rate + padding
+        seconds += samples / sample_rate
+    return seconds
+
+def _concat_wav(clips):
+    """ Join WAV clips into one track; returns (bytes, [(start_s, duration_s, byte_offset, size), ...]) """
+    params, frames, spans, position = None, [], [], 0
+    for clip in clips:
+        with wave.open(io.BytesIO(clip), "rb") as reader:
+            clip_params = reader.getparams()
+            if params is None:
+                params = clip_params
+            elif clip_params[:3] != params[:3]:
+                raise ValueError("Cannot concatenate WAV clips with different channels/width/rate")
+            data = reader.readframes(reader.getnframes())
+        count = len(data) // (params.sampwidth * params.nchannels)
+        frames.append(data)
+        spans.append([position / params.framerate, count / params.framerate, len(data)])
+        position += count
+    pcm = b"".join(frames)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(params.nchannels)
+        writer.setsampwidth(params.sampwidth)
+        writer.setframerate(params.framerate)
+        writer.writeframes(pcm)
+    audio = buffer.getvalue()
+    byte_offset = len(audio) - len(pcm)  # skip the RIFF header
+    for span in spans:
+        size = span.pop()
+        span.extend([byte_offset, size])
+        byte_offset += size
+    return audio, [tuple(span) for span in spans]
+
+def _concat_mp3(clips):
+    """ MP3 frames are self-contained, so clips can be joined byte for byte """
+    spans, position, byte_offset = [], 0.0, 0
+    for clip in clips:
+        duration = mp3_duration(clip)
+        spans.append((position, duration, byte_offset, len(clip)))
+        position += duration
+        byte_offset += len(clip)
+    return b"".join(clips), spans
+
+def render_deck_audio(flashcards, output_path=None, lang=DEFAULT_LANG, engine=None):
+    """ Synthesize a whole deck in parallel and join it into one track
+
+    flashcards is the {name: text} dict produced by generate_flashcards.
+    Returns {"audio", "format", "offsets"} where each offset gives the card
+    name, start/duration in seconds and the byte range of its audio in the track.
+    If output_path is given the track is written there, with the offsets
+    next to it as <output_path>.json.
+    """
+    engine = engine or DEFAULT_ENGINE
+    fmt = ENGINES[engine].format
+    names = [name for name, text in flashcards.items() if text and text.strip()]
+    futures = [synthesize_async(flashcards[name], lang, engine) for name in names]
+    clips = [future.result() for future in futures]
+
+    if not clips:
+        audio, spans = b"", []
+    elif fmt == "wav":
+        audio, spans = _concat_wav(clips)
+    else:
+        audio, spans = _concat_mp3(clips)
+
+    offsets = [{"card": name, "start_s": round(start, 3), "duration_s": round(duration, 3),
+                "byte_offset": byte_offset, "bytes": size}
+               for name, (start, duration, byte_offset, size) in zip(names, spans)]
+
+    if output_path:
+        with open(output_path, "wb") as f:
+            f.write(audio)
+        with open(output_path + ".json", "w") as f:
+            json.dump({"format": fmt, "engine": engine, "lang": lang, "offsets": offsets}, f, indent=2)
+    return {"audio": audio, "format": fmt, "offsets": offsets}
 
 def text_to_speech(text, filename="flashcard.mp3"):
     """ Convert extracted text to speech with better cross-platform support """
@@ -8,8 +272,8 @@ def text_to_speech(text, filename="flashcard.mp3"):
         print("Error: No text provided for speech synthesis.")
         return
     
-    tts = gTTS(text=text, lang="en")
-    tts.save(filename)
+    with open(filename, "wb") as f:
+        f.write(synthesize(text))
     print(f"Flashcard audio saved as {filename}")
 
     # Cross-platform audio playback
@@ -0,0 +1,244 @@
+import json
+import math
+import os
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from ranking import normalize_rows
+
+# Vectors are scanned in chunks of this many rows on the flat path
+SCAN_ROWS = 262144
+
+
+class VectorIndex:
+    """ Cosine-similarity index over L2-normalized float32 vectors, keyed by integer ids
+
+    Flat (exact) search scans the vectors in chunks. Once the index holds
+    ivf_threshold live vectors it trains an IVF partitioning (spherical
+    k-means centroids; nlist=0 disables it), after which a query only scans
+    the nprobe closest partitions plus vectors added since the partitions
+    were last rebuilt. Removal marks rows as deleted; they are compacted away
+    once they make up a quarter of the index.
+
+    With a directory, vectors live in a growable memmap (vectors.f32) and ids,
+    tombstones and IVF state are written by flush(), so the index reopens
+    without re-embedding anything.
+    """
+
+    def __init__(self, directory=None, nlist=None, nprobe=16, ivf_threshold=20000):
+        self.directory = directory
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ivf_threshold = ivf_threshold
+        self.dim = None
+        self.count = 0        # rows in use, including deleted ones
+        self.capacity = 0
+        self.vectors = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.deleted = np.empty(0, dtype=bool)
+        self.assign = np.empty(0, dtype=np.int32)
+        self.centroids = None
+        self.row_of = {}
+        self._lists = None    # (rows sorted by partition, partition offsets, rows covered)
+        self._lock = threading.RLock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    # --- storage
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if not os.path.exists(self._path("index.json")):
+            return
+        try:
+            with open(self._path("index.json"), "r") as f:
+                meta = json.load(f)
+            state = np.load(self._path("index.npz"))
+            self.dim, self.count, self.capacity = meta["dim"], meta["count"], meta["capacity"]
+            self.vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+",
+                                     shape=(self.capacity, self.dim))
+            self.ids = _grow(state["ids"], self.capacity)
+            self.deleted = _grow(state["deleted"], self.capacity)
+            self.assign = _grow(state["assign"], self.capacity)
+            self.centroids = state["centroids"] if state["centroids"].size else None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading vector index: {e}")
+            self.dim, self.count, self.capacity, self.vectors, self.centroids = None, 0, 0, None, None
+            return
+        self.row_of = {int(i): row for row, i in enumerate(self.ids[:self.count]) if not self.deleted[row]}
+
+    def flush(self):
+        with self._lock:
+            if not self.directory or self.vectors is None:
+                return
+            self.vectors.flush()
+            with open(self._path("index.npz.tmp"), "wb") as f:
+                np.savez(f, ids=self.ids[:self.count], deleted=self.deleted[:self.count],
+                         assign=self.assign[:self.count],
+                         centroids=self.centroids if self.centroids is not None else np.empty((0, 0)))
+            os.replace(self._path("index.npz.tmp"), self._path("index.npz"))
+            with open(self._path("index.json.tmp"), "w") as f:
+                json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity}, f)
+            os.replace(self._path("index.json.tmp"), self._path("index.json"))
+
+    def _reserve(self, needed):
+        if needed <= self.capacity:
+            return
+        capacity = max(1024, 2 * self.capacity, needed)
+        if self.directory:
+            if self.vectors is not None:
+                self.vectors.flush()
+            with open(self._path("vectors.f32"), "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+            self.vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r+",
+                                     shape=(capacity, self.dim))
+        else:
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            if self.vectors is not None:
+                grown[:self.count] = self.vectors[:self.count]
+            self.vectors = grown
+        self.ids = _grow(self.ids, capacity)
+        self.deleted = _grow(self.deleted, capacity)
+        self.assign = _grow(self.assign, capacity)
+        self.capacity = capacity
+
+    # --- updates
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def add(self, ids, vectors):
+        """ Insert (or replace) vectors under the given ids """
+        vectors = normalize_rows(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+            self.remove(ids)
+            start, stop = self.count, self.count + len(ids)
+            self._reserve(stop)
+            self.vectors[start:stop] = vectors
+            self.ids[start:stop] = ids
+            self.deleted[start:stop] = False
+            self.assign[start:stop] = self._nearest_centroid(vectors) if self.centroids is not None else -1
+            self.row_of.update(zip(ids.tolist(), range(start, stop)))
+            self.count = stop
+            if self.centroids is None and self.nlist != 0 and len(self) >= self.ivf_threshold:
+                self.train()
+
+    def remove(self, ids):
+        with self._lock:
+            for i in np.asarray(ids, dtype=np.int64).tolist():
+                row = self.row_of.pop(i, None)
+                if row is not None:
+                    self.deleted[row] = True
+            if self.count > 1024 and self.count - len(self) > self.count // 4:
+                self.compact()
+
+    def compact(self):
+        """ Drop deleted rows, keeping the surviving rows in their original order """
+        with self._lock:
+            live = np.flatnonzero(~self.deleted[:self.count])
+            n = len(live)
+            self.vectors[:n] = self.vectors[live]
+            self.ids[:n] = self.ids[live]
+            self.assign[:n] = self.assign[live]
+            self.deleted[:n] = False
+            self.count = n
+            self.row_of = {int(i): row for row, i in enumerate(self.ids[:n])}
+            self._lists = None
+
+    # --- IVF
+
+    def _nearest_centroid(self, vectors, block=8192):
+        assign = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block):
+            assign[start:start + block] = np.argmax(vectors[start:start + block] @ self.centroids.T, axis=1)
+        return assign
+
+    def train(self, nlist=None, iters=10, sample=65536, seed=0):
+        """ Fit IVF centroids with spherical k-means on a sample, then partition every row """
+        with self._lock:
+            live = np.flatnonzero(~self.deleted[:self.count])
+            nlist = nlist or self.nlist or int(min(4096, max(16, 2 * math.sqrt(len(live)))))
+            if len(live) < nlist:
+                return
+            rng = np.random.default_rng(seed)
+            X = np.asarray(self.vectors[np.sort(rng.choice(live, min(sample, len(live)), replace=False))])
+            C = X[rng.choice(len(X), nlist, replace=False)]
+            for _ in range(iters):
+                self.centroids = C
+                labels = self._nearest_centroid(X)
+                members = sparse.csr_matrix((np.ones(len(X), dtype=np.float32), (labels, np.arange(len(X)))),
+                                            shape=(nlist, len(X)))
+                sums = np.asarray(members @ X)
+                empty = np.asarray(members.sum(axis=1)).ravel() == 0
+                sums[empty] = C[empty]  # empty partitions keep their old centroid
+                C = normalize_rows(sums)
+            self.centroids = C
+            for start in range(0, self.count, SCAN_ROWS):
+                stop = min(start + SCAN_ROWS, self.count)
+                self.assign[start:stop] = self._nearest_centroid(np.asarray(self.vectors[start:stop]))
+            self._lists = None
+
+    def _inverted_lists(self):
+        # Rebuilt lazily once the unpartitioned tail grows past a tenth of the index
+        if self._lists is None or self.count - self._lists[2] > max(1024, self._lists[2] // 10):
+            assign = self.assign[:self.count]
+            order = np.argsort(assign, kind="stable")
+            offsets = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, offsets, self.count)
+        return self._lists
+
+    # --- queries
+
+    def search(self, query, k=10):
+        """ The k most similar live vectors to query as [(id, cosine similarity)], best first """
+        with self._lock:
+            if not len(self):
+                return []
+            q = normalize_rows(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+            if self.centroids is None:
+                chunks = (np.arange(start, min(start + SCAN_ROWS, self.count))
+                          for start in range(0, self.count, SCAN_ROWS))
+            else:
+                order, offsets, covered = self._inverted_lists()
+                probes = np.argsort(-(self.centroids @ q))[:self.nprobe]
+                candidates = [order[offsets[p]:offsets[p + 1]] for p in probes]
+                candidates.append(np.arange(covered, self.count))
+                chunks = [np.sort(np.concatenate(candidates))]
+
+            best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            for rows in chunks:
+                if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+                    scores = self.vectors[rows[0]:rows[-1] + 1] @ q   # contiguous: no gather copy
+                else:
+                    scores = self.vectors[rows] @ q
+                scores[self.deleted[rows]] = -np.inf
+                best_rows = np.concatenate([best_rows, rows])
+                best_scores = np.concatenate([best_scores, scores])
+                if len(best_scores) > k:
+                    top = np.argpartition(best_scores, -k)[-k:]
+                    best_rows, best_scores = best_rows[top], best_scores[top]
+            ranked = np.argsort(-best_scores)
+            return [(int(self.ids[best_rows[i]]), float(best_scores[i]))
+                    for i in ranked if np.isfinite(best_scores[i])]
+
+    def stats(self):
+        return {"vectors": len(self), "rows": self.count, "dim": self.dim,
+                "partitions": 0 if self.centroids is None else len(self.centroids)}
+
+
+def _grow(array, capacity):
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[:min(len(array), capacity)] = array[:capacity]
+    return grown